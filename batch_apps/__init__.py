@@ -0,0 +1 @@
+default_app_config = 'batch_apps.apps.BatchAppsConfig'
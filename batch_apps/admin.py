@@ -1,8 +1,9 @@
 from django.contrib import admin
-from batch_apps.models import App, Pattern, Day, Execution
+from batch_apps.models import App, Pattern, Day, Execution, Lease, ProcessingCursor, ScheduleRule, SubjectFingerprint
 from django.db import models
 from django.forms import TextInput
-from batch_apps.integration import execute_end_to_end_tasks
+from batch_apps.integration import execute_end_to_end_tasks_for_dates
+from batch_apps.generator import get_current_date_in_gmt8
 
 admin.site.index_template = 'admin/my_index.html'
 
@@ -10,6 +11,12 @@ admin.site.index_template = 'admin/my_index.html'
 class PatternInline(admin.TabularInline):
     model = Pattern
     extra = 0
+    readonly_fields = ('kind', 'match_count', 'hit_count', 'match_time')
+
+
+class ScheduleRuleInline(admin.TabularInline):
+    model = ScheduleRule
+    extra = 0
 
 
 class AppAdmin(admin.ModelAdmin):
@@ -22,20 +29,33 @@ class AppAdmin(admin.ModelAdmin):
         (None, {'fields': ['country']}),
         (None, {'fields': ['category']}),
         (None, {'fields': ['repo']}),
+        (None, {'fields': ['senders']}),
         ('Description', {'fields': ['description'], }),
     ]
-    inlines = [PatternInline]
+    inlines = [PatternInline, ScheduleRuleInline]
 
     formfield_overrides = {
         models.CharField: {'widget': TextInput(attrs={'size': '150'})},
     }
 
+    def save_related(self, request, form, formsets, change):
+        # Runs after the inline Schedule rules are saved, so a single refresh
+        # sees the App's final schedule.
+        super(AppAdmin, self).save_related(request, form, formsets, change)
+        Execution.objects.refresh_apps([form.instance.id], get_current_date_in_gmt8())
+
     def activate_apps(self, request, queryset):
+        app_ids = list(queryset.values_list('id', flat=True))
         queryset.update(is_active=True)
+        SubjectFingerprint.objects.invalidate()
+        Execution.objects.refresh_apps(app_ids, get_current_date_in_gmt8())
     activate_apps.short_description = "Activate selected Apps"
 
     def deactivate_apps(self, request, queryset):
+        app_ids = list(queryset.values_list('id', flat=True))
         queryset.update(is_active=False)
+        SubjectFingerprint.objects.invalidate()
+        Execution.objects.refresh_apps(app_ids, get_current_date_in_gmt8())
     deactivate_apps.short_description = "Deactivate selected Apps"
 
 
@@ -51,10 +71,19 @@ class DayAdmin(admin.ModelAdmin):
     inlines = [ExecutionInline]
 
     def execute_end_to_end_tasks_on_day(self, request, queryset):
-        for day in queryset:
-            execute_end_to_end_tasks(day.date)
+        execute_end_to_end_tasks_for_dates([day.date for day in queryset])
     execute_end_to_end_tasks_on_day.short_description = "Generate objects and process emails"
 
 
+class ProcessingCursorAdmin(admin.ModelAdmin):
+    list_display = ('mailbox', 'last_message_id')
+
+
+class LeaseAdmin(admin.ModelAdmin):
+    list_display = ('key', 'holder', 'heartbeat_at', 'expires_at')
+
+
 admin.site.register(App, AppAdmin)
 admin.site.register(Day, DayAdmin)
+admin.site.register(ProcessingCursor, ProcessingCursorAdmin)
+admin.site.register(Lease, LeaseAdmin)
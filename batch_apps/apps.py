@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class BatchAppsConfig(AppConfig):
+    name = 'batch_apps'
+
+    def ready(self):
+        import batch_apps.signals  # noqa
@@ -0,0 +1,45 @@
+from email.parser import BytesFeedParser
+from django_mailbox.models import ATTACHMENT_INTERPOLATION_HEADER
+import base64
+
+# A multiple of 4 so that every chunk of the stored base64 body decodes on its own
+BASE64_CHUNK_SIZE = 4 * 1024
+
+
+def iter_body_bytes(body, encoded, limit):
+    if not encoded:
+        yield body[:limit].encode('utf-8')[:limit]
+        return
+
+    remaining = limit
+    for start in range(0, len(body), BASE64_CHUNK_SIZE):
+        data = base64.b64decode(body[start:start + BASE64_CHUNK_SIZE])
+        yield data[:remaining]
+
+        remaining -= len(data)
+        if remaining <= 0:
+            return
+
+
+def extract_plain_text(body, encoded, limit):
+    # Reads the stored (dehydrated) message directly instead of going through
+    # Message.get_email_object(), so attachments are never loaded back from
+    # storage and only the first `limit` bytes of the body are ever decoded.
+    parser = BytesFeedParser()
+    for data in iter_body_bytes(body, encoded, limit):
+        parser.feed(data)
+    message = parser.close()
+
+    texts = []
+    for part in message.walk():
+        if (part.is_multipart() or part.get_content_type() != 'text/plain' or
+                ATTACHMENT_INTERPOLATION_HEADER in part or part.get_filename()):
+            continue
+
+        payload = part.get_payload(decode=True) or b''
+        try:
+            texts.append(payload.decode(part.get_content_charset() or 'utf-8', 'replace'))
+        except LookupError:
+            texts.append(payload.decode('utf-8', 'replace'))
+
+    return '\n'.join(texts)
@@ -1,3 +1,4 @@
+from django.utils import timezone
 import datetime
 import pytz
 
@@ -7,6 +8,15 @@ def get_current_date_in_gmt8():
     return current_datetime.date()
 
 
+def get_date_in_gmt8(datetime_):
+    # Date headers with a "-0000" offset parse to naive datetimes, which
+    # Django stores in TIME_ZONE, so they are read the same way here.
+    if timezone.is_naive(datetime_):
+        datetime_ = timezone.make_aware(datetime_, timezone.get_default_timezone())
+
+    return datetime_.astimezone(pytz.timezone('Asia/Kuala_Lumpur')).date()
+
+
 def generate_one_week_date(week_ending_date):
     dates_backward = []
     dates_backward.append(week_ending_date)
@@ -1,41 +1,480 @@
-from django_mailbox.models import Message
-from batch_apps.models import Execution
-from batch_apps.generator import get_current_date_in_gmt8
-from batch_apps.matcher import match_email_subject_to_app
+from django.conf import settings
+from django.db import transaction
+from django_mailbox.models import Mailbox, Message
+from django_mailbox.signals import message_received
+from batch_apps.models import (
+    PROCESSED_UNMATCHED_MESSAGE_CONDITION,
+    SQLITE_MAX_VARIABLES,
+    UNPROCESSED_MESSAGE_CONDITION,
+    App,
+    Execution,
+    Lease,
+    Pattern,
+    ProcessingCursor,
+    RematchRequest,
+    SubjectFingerprint,
+    day_lease_key,
+    mailbox_lease_key,
+    make_lease_holder,
+)
+from batch_apps.generator import date_to_str, get_current_date_in_gmt8
+from batch_apps.matcher import CompiledPatternSet, SenderIndex, SubjectMatcher
+from batch_apps.content import extract_plain_text
+from collections import namedtuple
+import datetime
+import time
 
+MATCHING_PROCESSES = getattr(settings, 'BATCHER_MATCHING_PROCESSES', None)
+PATTERN_TIME_BUDGET = getattr(settings, 'BATCHER_PATTERN_TIME_BUDGET', None)
+CASE_INSENSITIVE_MATCHING = getattr(settings, 'BATCHER_CASE_INSENSITIVE_MATCHING', False)
+CONTENT_SCAN_LIMIT = getattr(settings, 'BATCHER_CONTENT_SCAN_LIMIT', 64 * 1024)
+REMATCH_LOOK_BACK_DAYS = getattr(settings, 'BATCHER_REMATCH_LOOK_BACK_DAYS', 7)
+LEASE_SECONDS = getattr(settings, 'BATCHER_LEASE_SECONDS', 300)
+
+REMATCH_LEASE_KEY = 'rematch'
+
+EMAIL_CHUNK_SIZE = 1000
+
+EmailRow = namedtuple('EmailRow', ['id', 'subject', 'subject_normalized', 'sender_address', 'sent_date_local'])
+PatternSnapshot = namedtuple('PatternSnapshot', ['pattern_rows', 'app_senders', 'pattern_set', 'sender_index',
+                                                 'fingerprint_cache'])
+
+_pattern_snapshot = {}
+
+
+def execute_end_to_end_tasks(date_=None, snapshot=None):
+    if date_ is None:
+        date_ = get_current_date_in_gmt8()
 
-def execute_end_to_end_tasks(date_=get_current_date_in_gmt8()):
     Execution.objects.generate_and_return_active_apps_execution_objects(date_)
-    process_emails(date_)
+    report = process_emails(date_, snapshot)
+    report['rematched_apps'] = process_rematch_requests(date_)
+    return report
+
+
+def execute_end_to_end_tasks_for_dates(dates, dry_run=False, progress=None):
+    if not dry_run:
+        Execution.objects.generate_executions_for_dates(dates)
+        return process_dates(dates, progress, use_cursor=False)
+
+    with transaction.atomic():
+        Execution.objects.generate_executions_for_dates(dates)
+        report = process_dates(dates, progress, use_cursor=False)
+        transaction.set_rollback(True)
+
+    return report
+
+
+def process_emails(date_, snapshot=None):
+    return process_dates([date_], snapshot=snapshot)
+
+
+def fetch_new_mail():
+    holder = make_lease_holder()
+    messages = []
+
+    for mailbox in Mailbox.active_mailboxes.all():
+        key = mailbox_lease_key(mailbox.id)
+        if not Lease.objects.acquire(key, holder, LEASE_SECONDS):
+            continue
+
+        # A long fetch renews its lease as messages arrive, so another worker
+        # cannot take the mailbox over and fetch the same messages again.
+        def renew_lease(sender, **kwargs):
+            Lease.objects.heartbeat(holder, LEASE_SECONDS)
+
+        message_received.connect(renew_lease, sender=mailbox)
+        try:
+            messages.extend(mailbox.get_new_mail())
+        finally:
+            message_received.disconnect(renew_lease, sender=mailbox)
+            Lease.objects.release(holder, key)
+
+    return messages
+
+
+def process_dates(dates, progress=None, use_cursor=True, snapshot=None):
+    # Days leased by another worker are skipped rather than waited for.
+    # Explicitly requested days may hold messages the cursor has moved past,
+    # so those are selected by date alone.
+    start = time.time()
+    holder = make_lease_holder()
+    dates = sorted(set(dates))
+    leased_dates = [date_ for date_ in dates if Lease.objects.acquire(day_lease_key(date_), holder, LEASE_SECONDS)]
+    report = {'days': len(leased_dates), 'skipped_days': len(dates) - len(leased_dates), 'emails': 0,
+              'fingerprint_hit_rate': 0.0, 'rows_written': 0, 'seconds': 0.0}
+
+    if leased_dates:
+        try:
+            match_dates(leased_dates, report, holder, progress, use_cursor, snapshot)
+        finally:
+            Lease.objects.release(holder)
+
+    report['seconds'] = time.time() - start
+    return report
+
+
+def match_dates(dates, report, holder, progress=None, use_cursor=True, snapshot=None):
+    executions_due = get_due_execution_ids_between(dates[0], dates[-1])
+    executions_due = dict((key, execution_ids) for key, execution_ids in executions_due.items() if key[0] in dates)
+
+    if not executions_due:
+        return
+
+    emails = get_unprocessed_unmatched_emails_between(dates[0], dates[-1], use_cursor)
+
+    if progress is not None:
+        progress('%d emails over %d days, %d due executions' % (emails.count(), len(dates), len(executions_due)))
+
+    if snapshot is None:
+        snapshot = build_pattern_snapshot(*get_pattern_snapshot_rows())
+
+    # A resident snapshot outlives the run, so only this run's counts are recorded
+    pattern_set = snapshot.pattern_set
+    pattern_set.reset_stats()
+    fingerprint_cache = snapshot.fingerprint_cache
+    fingerprint_cache.reset_counts()
+    app_ids = set(app_id for date_, app_id in executions_due) | pattern_set.date_capturing_app_ids
+    counts_by_date = dict((date_, [0, 0]) for date_ in dates)
+
+    with SubjectMatcher(snapshot.pattern_rows, snapshot.app_senders, processes=MATCHING_PROCESSES,
+                        chunk_size=EMAIL_CHUNK_SIZE, pattern_set=pattern_set,
+                        sender_index=snapshot.sender_index) as matcher:
+        for email_rows in iter_email_rows(emails, EMAIL_CHUNK_SIZE * max(1, MATCHING_PROCESSES or 1)):
+            # Stop as soon as a day lease has expired, it may be held by another worker by now
+            if Lease.objects.heartbeat(holder, LEASE_SECONDS) < len(dates):
+                break
+
+            email_rows = [row for row in email_rows if row.sent_date_local in counts_by_date]
+            SubjectFingerprint.objects.load_entries(fingerprint_cache, [pattern_set.fingerprint(row.subject)
+                                                                        for row in email_rows])
+            match_matrix = matcher.match([row.subject for row in email_rows],
+                                         app_ids,
+                                         fingerprint_cache=fingerprint_cache,
+                                         normalized_subjects=[row.subject_normalized for row in email_rows],
+                                         sender_addresses=[row.sender_address for row in email_rows])
+
+            match_matrix = route_matches([row.subject for row in email_rows],
+                                         [row.sent_date_local for row in email_rows],
+                                         match_matrix, pattern_set, executions_due)
+            match_matrix = filter_routed_content_matches([row.id for row in email_rows], match_matrix, pattern_set)
+
+            for row, matched_app_ids in zip(email_rows, match_matrix):
+                counts_by_date[row.sent_date_local][0] += 1
+                counts_by_date[row.sent_date_local][1] += int(bool(matched_app_ids))
+
+            report['emails'] += len(email_rows)
+            report['rows_written'] += apply_match_matrix([row.id for row in email_rows], match_matrix,
+                                                         executions_due)
+
+    if progress is not None:
+        for date_ in dates:
+            progress('%s: %d emails, %d matched' % ((date_to_str(date_),) + tuple(counts_by_date[date_])))
+
+    Pattern.objects.record_match_stats(pattern_set.stats)
+    SubjectFingerprint.objects.save_cache(fingerprint_cache)
+
+    if use_cursor:
+        ProcessingCursor.objects.advance(dates[-1])
+
+    report['fingerprint_hit_rate'] = fingerprint_cache.hit_rate
+
+
+def iter_email_rows(emails, chunk_size):
+    # Keyset pagination over the matching columns only, so neither the body
+    # nor more than one chunk of rows is ever held in memory.
+    last_id = 0
+
+    while True:
+        email_rows = [EmailRow(*row) for row in
+                      emails.filter(id__gt=last_id).order_by('id').values_list(*EmailRow._fields)[:chunk_size]]
+
+        if not email_rows:
+            return
+
+        yield email_rows
+        last_id = email_rows[-1].id
+
+
+def process_rematch_requests(date_):
+    holder = make_lease_holder()
+    if not Lease.objects.acquire(REMATCH_LEASE_KEY, holder, LEASE_SECONDS):
+        return []
+
+    try:
+        requests = RematchRequest.objects.pending()
+
+        if not requests:
+            return []
+
+        app_ids = sorted(set(app_id for request_id, app_id in requests))
+        rematch_apps(app_ids, date_ - datetime.timedelta(days=REMATCH_LOOK_BACK_DAYS), date_)
+        RematchRequest.objects.complete([request_id for request_id, app_id in requests])
+        return app_ids
+    finally:
+        Lease.objects.release(holder)
+
+
+def rematch_apps(app_ids, start_date, end_date):
+    # Only emails that a previous pass processed without any match are
+    # revisited; unprocessed ones are left to the regular pass.
+    executions_due = get_due_execution_ids_between(start_date, end_date, app_ids)
+
+    if not executions_due:
+        return 0
+
+    pattern_rows = list(Pattern.objects.active_pattern_rows().filter(app_id__in=app_ids))
+    app_senders = list(App.objects.filter(id__in=app_ids).exclude(senders='').values_list('id', 'senders'))
+    pattern_set = CompiledPatternSet(pattern_rows,
+                                     time_budget=PATTERN_TIME_BUDGET,
+                                     case_insensitive=CASE_INSENSITIVE_MATCHING)
+    emails = Message.objects.filter(sent_date_local__range=(start_date, end_date)).extra(
+        where=PROCESSED_UNMATCHED_MESSAGE_CONDITION)
+    rows_written = 0
+
+    with SubjectMatcher(pattern_rows, app_senders, pattern_set=pattern_set) as matcher:
+        for email_rows in iter_email_rows(emails, EMAIL_CHUNK_SIZE):
+            match_matrix = matcher.match([row.subject for row in email_rows],
+                                         app_ids,
+                                         normalized_subjects=[row.subject_normalized for row in email_rows],
+                                         sender_addresses=[row.sender_address for row in email_rows])
+            match_matrix = route_matches([row.subject for row in email_rows],
+                                         [row.sent_date_local for row in email_rows],
+                                         match_matrix, pattern_set, executions_due)
+            match_matrix = filter_routed_content_matches([row.id for row in email_rows], match_matrix, pattern_set)
+            rows_written += apply_match_matrix([row.id for row in email_rows], match_matrix, executions_due,
+                                               mark_processed=False)
+
+    Pattern.objects.record_match_stats(pattern_set.stats)
+    return rows_written
+
+
+def process_incoming_email(email):
+    if email.outgoing or email.processed_batch_apps or email.sent_date_local is None:
+        return []
+
+    email_date = email.sent_date_local
+    executions_due = get_due_execution_ids_between(email_date, email_date)
+
+    if not executions_due:
+        return []
+
+    # The snapshot is shared with other passes, so only this email's counts are recorded
+    pattern_set, sender_index = get_pattern_snapshot()
+    pattern_set.reset_stats()
+    app_ids = set(app_id for date_, app_id in executions_due) | pattern_set.date_capturing_app_ids
+    app_ids = sender_index.filter_app_ids(email.sender_address, sorted(app_ids))
+
+    with pattern_set.time_budget_guard():
+        matched_app_ids = pattern_set.match_apps(email.subject, app_ids, normalized_subject=email.subject_normalized)
+    match_matrix = route_matches([email.subject], [email_date], [matched_app_ids], pattern_set, executions_due)
+    match_matrix = filter_routed_content_matches([email.id], match_matrix, pattern_set)
+    Pattern.objects.record_match_stats(pattern_set.stats)
 
+    # Unmatched emails stay unprocessed so the batch pass still considers them
+    if match_matrix[0]:
+        apply_match_matrix([email.id], match_matrix, executions_due)
 
-def process_emails(date_):
-    executions_due = get_unexecuted_due_executions(date_)
-    emails = get_unprocessed_unmatched_emails(date_)
+    return match_matrix[0]
 
-    for email in emails:
-        for execution in executions_due:
-            matched = match_email_subject_to_app(email.subject, execution.app)
 
-            if matched is True:
-                email.matched_batch_apps = True
-                execution.is_executed = True
-                execution.email = email
-                execution.save()
+def get_pattern_snapshot():
+    if not _pattern_snapshot:
+        load_pattern_snapshot(*get_pattern_snapshot_rows())
 
-            email.processed_batch_apps = True
-            email.save()
+    snapshot = _pattern_snapshot['snapshot']
+    return snapshot.pattern_set, snapshot.sender_index
+
+
+def refresh_pattern_snapshot():
+    # Saves made by another process (the admin) never reach this process'
+    # signal handlers, so a resident worker compares the rows every cycle and
+    # only recompiles when they differ.
+    rows = get_pattern_snapshot_rows()
+
+    if _pattern_snapshot.get('rows') != rows:
+        load_pattern_snapshot(*rows)
+
+    return _pattern_snapshot['snapshot']
+
+
+def get_pattern_snapshot_rows():
+    return (list(Pattern.objects.active_pattern_rows().order_by('id')),
+            list(App.objects.exclude(senders='').order_by('id').values_list('id', 'senders')))
+
+
+def build_pattern_snapshot(pattern_rows, app_senders):
+    pattern_set = CompiledPatternSet(pattern_rows,
+                                     time_budget=PATTERN_TIME_BUDGET,
+                                     case_insensitive=CASE_INSENSITIVE_MATCHING)
+    return PatternSnapshot(pattern_rows, app_senders, pattern_set, SenderIndex(app_senders),
+                           SubjectFingerprint.objects.load_cache(pattern_rows))
+
+
+def load_pattern_snapshot(pattern_rows, app_senders):
+    _pattern_snapshot['rows'] = (pattern_rows, app_senders)
+    _pattern_snapshot['snapshot'] = build_pattern_snapshot(pattern_rows, app_senders)
+
+
+def invalidate_pattern_snapshot():
+    _pattern_snapshot.clear()
+
+
+def describe_report(report):
+    description = '%d emails processed, %d rows written in %.2fs, fingerprint cache hit rate %.1f%%' % (
+        report['emails'], report['rows_written'], report['seconds'], report['fingerprint_hit_rate'] * 100)
+
+    if report.get('skipped_days'):
+        description += ', %d days skipped as leased by another worker' % report['skipped_days']
+
+    return description
+
+
+def route_matches(subjects, email_dates, match_matrix, pattern_set, execution_ids_by_key):
+    # A captured date credits the execution of that day instead of the
+    # email's own date; executions outside the loaded range are looked up
+    # once and remembered, including the ones that do not exist.
+    routed_matrix = []
+
+    for subject, email_date, matched_app_ids in zip(subjects, email_dates, match_matrix):
+        keys = []
+
+        for app_id in matched_app_ids:
+            captured_date = None
+            if app_id in pattern_set.date_capturing_app_ids:
+                captured_date = pattern_set.captured_date(subject, app_id)
+
+            keys.append((captured_date or email_date, app_id))
+
+        routed_matrix.append(keys)
+
+    missing_keys = set(key for keys in routed_matrix for key in keys if key not in execution_ids_by_key)
+    if missing_keys:
+        execution_ids_by_key.update(get_due_execution_ids_for_keys(missing_keys))
+
+    return [[key for key in keys if execution_ids_by_key[key]] for keys in routed_matrix]
+
+
+def filter_routed_content_matches(email_ids, routed_matrix, pattern_set):
+    match_matrix = filter_content_matches(email_ids, [[app_id for date_, app_id in keys] for keys in routed_matrix],
+                                          pattern_set)
+
+    return [[key for key in keys if key[1] in matched_app_ids]
+            for keys, matched_app_ids in zip(routed_matrix, match_matrix)]
+
+
+def filter_content_matches(email_ids, match_matrix, pattern_set):
+    if not pattern_set.content_app_ids:
+        return match_matrix
+
+    indexes_by_email_id = dict((email_id, i) for i, email_id in enumerate(email_ids)
+                               if pattern_set.content_app_ids.intersection(match_matrix[i]))
+    candidate_ids = sorted(indexes_by_email_id)
+    unread_ids = set(candidate_ids)
+
+    # Bodies are streamed rather than loaded for the whole chunk at once
+    with pattern_set.time_budget_guard():
+        for i in range(0, len(candidate_ids), SQLITE_MAX_VARIABLES):
+            bodies = Message.objects.filter(id__in=candidate_ids[i:i + SQLITE_MAX_VARIABLES]).values_list(
+                'id', 'body', 'encoded')
+
+            for email_id, body, encoded in bodies.iterator():
+                content = extract_plain_text(body, encoded, CONTENT_SCAN_LIMIT)
+                index = indexes_by_email_id[email_id]
+                match_matrix[index] = [app_id for app_id in match_matrix[index]
+                                       if pattern_set.match_content(content, app_id)]
+                unread_ids.discard(email_id)
+
+    # Emails deleted since the chunk was selected cannot confirm any content pattern
+    for email_id in unread_ids:
+        index = indexes_by_email_id[email_id]
+        match_matrix[index] = [app_id for app_id in match_matrix[index] if app_id not in pattern_set.content_app_ids]
+
+    return match_matrix
+
+
+def apply_match_matrix(email_ids, match_matrix, execution_ids_by_key, mark_processed=True):
+    matched_email_ids = []
+    email_id_by_execution = {}
+
+    for email_id, matched_keys in zip(email_ids, match_matrix):
+        if matched_keys:
+            matched_email_ids.append(email_id)
+
+        for key in matched_keys:
+            for execution_id in execution_ids_by_key[key]:
+                email_id_by_execution[execution_id] = email_id
+
+    execution_ids_by_email = {}
+    for execution_id, email_id in email_id_by_execution.items():
+        execution_ids_by_email.setdefault(email_id, []).append(execution_id)
+
+    with transaction.atomic():
+        rows_written = update_in_chunks(Message, matched_email_ids, matched_batch_apps=True)
+        if mark_processed:
+            rows_written += update_in_chunks(Message, list(email_ids), processed_batch_apps=True)
+
+        for email_id, execution_ids in execution_ids_by_email.items():
+            rows_written += update_in_chunks(Execution, execution_ids, is_executed=True, email=email_id)
+
+    return rows_written
+
+
+def update_in_chunks(model, ids, **values):
+    rows_written = 0
+
+    for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        rows_written += model.objects.filter(id__in=ids[i:i + SQLITE_MAX_VARIABLES]).update(**values)
+
+    return rows_written
+
+
+def get_due_execution_ids_between(start_date, end_date, app_ids=None):
+    execution_ids_by_key = {}
+    executions = get_unexecuted_due_executions_between(start_date, end_date)
+
+    if app_ids is not None:
+        executions = executions.filter(app_id__in=app_ids)
+
+    for execution_id, date_, app_id in executions.values_list('id', 'day__date', 'app_id'):
+        execution_ids_by_key.setdefault((date_, app_id), []).append(execution_id)
+
+    return execution_ids_by_key
+
+
+def get_due_execution_ids_for_keys(keys):
+    execution_ids_by_key = dict((key, []) for key in keys)
+    app_ids = sorted(set(app_id for date_, app_id in keys))
+    dates = sorted(set(date_ for date_, app_id in keys))
+
+    for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES // 2):
+        for j in range(0, len(dates), SQLITE_MAX_VARIABLES // 2):
+            executions = Execution.objects.filter(app_id__in=app_ids[i:i + SQLITE_MAX_VARIABLES // 2],
+                                                  day__date__in=dates[j:j + SQLITE_MAX_VARIABLES // 2],
+                                                  is_due_today=True,
+                                                  is_executed=False)
+
+            for execution_id, date_, app_id in executions.values_list('id', 'day__date', 'app_id'):
+                if (date_, app_id) in execution_ids_by_key:
+                    execution_ids_by_key[(date_, app_id)].append(execution_id)
+
+    return execution_ids_by_key
 
 
 def get_unexecuted_due_executions(date_):
-    return Execution.objects.filter(day__date=date_,
+    return get_unexecuted_due_executions_between(date_, date_)
+
+
+def get_unexecuted_due_executions_between(start_date, end_date):
+    return Execution.objects.filter(day__date__range=(start_date, end_date),
                                     is_due_today=True,
                                     is_executed=False)
 
 
 def get_unprocessed_unmatched_emails(date_):
-    return Message.objects.filter(sent_time__year=date_.year,
-                                  sent_time__month=date_.month,
-                                  sent_time__day=date_.day,
-                                  processed_batch_apps=False,
-                                  matched_batch_apps=False)
+    return get_unprocessed_unmatched_emails_between(date_, date_)
+
+
+def get_unprocessed_unmatched_emails_between(start_date, end_date, use_cursor=True):
+    messages = ProcessingCursor.objects.unconsidered_messages() if use_cursor else Message.objects.all()
+    return messages.filter(sent_date_local__range=(start_date, end_date)).extra(where=UNPROCESSED_MESSAGE_CONDITION)
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from batch_apps.integration import describe_report, execute_end_to_end_tasks, fetch_new_mail, refresh_pattern_snapshot
+from batch_apps.generator import get_current_date_in_gmt8
+from batch_apps.models import Execution
+from optparse import make_option
+import datetime
+import logging
+import signal
+import threading
+
+DAEMON_INTERVAL = getattr(settings, 'BATCHER_DAEMON_INTERVAL', 60)
+MATERIALIZE_DAYS_AHEAD = getattr(settings, 'BATCHER_MATERIALIZE_DAYS_AHEAD', 7)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='float', dest='interval', default=DAEMON_INTERVAL),
+        make_option('--cycles', type='int', dest='cycles', default=0,
+                    help='Stop after this many cycles, 0 to run until SIGTERM'),
+    )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.last_date = None
+        previous_handlers = dict((signum, signal.signal(signum, self.stop))
+                                 for signum in (signal.SIGTERM, signal.SIGINT))
+        cycles = 0
+
+        try:
+            while True:
+                self.run_cycle()
+                cycles += 1
+
+                if self.stopping.is_set() or (options['cycles'] and cycles >= options['cycles']):
+                    break
+
+                # Honours CONN_MAX_AGE like the end of a request would
+                close_old_connections()
+
+                if self.stopping.wait(options['interval']):
+                    break
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write('batcher_daemon stopped after %d cycles' % cycles)
+
+    def stop(self, signum, frame):
+        self.stopping.set()
+
+    def run_cycle(self):
+        # A failing cycle (mailbox unreachable, database locked) is logged and
+        # retried on the next one instead of taking the daemon down.
+        try:
+            today = get_current_date_in_gmt8()
+            snapshot = refresh_pattern_snapshot()
+            Execution.objects.materialize(today, MATERIALIZE_DAYS_AHEAD)
+            fetch_new_mail()
+
+            # Emails of late evening only arrive after midnight, so the day
+            # that just ended gets one last pass, as process_previous_day does.
+            if self.last_date is not None and self.last_date < today:
+                report = execute_end_to_end_tasks(today - datetime.timedelta(days=1), snapshot)
+                self.stdout.write(describe_report(report))
+
+            self.stdout.write(describe_report(execute_end_to_end_tasks(today, snapshot)))
+            self.last_date = today
+        except Exception:
+            logger.exception('batcher_daemon cycle failed')
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from batch_apps.matcher import CompiledPatternSet
+from optparse import make_option
+import random
+import time
+
+VERBS = ['Send', 'Generate', 'Refresh', 'Archive', 'Sync', 'Export', 'Import', 'Purge']
+NOUNS = ['ExpiringNotice', 'Listing', 'Enquiry', 'Report', 'Invoice', 'Alert', 'Feed', 'Digest']
+COUNTRIES = ['SG', 'MY']
+
+
+def generate_synthetic_corpus(app_count=1000, email_count=5000, seed=0):
+    rng = random.Random(seed)
+    pattern_rows = []
+    subjects = []
+
+    for app_id in range(1, app_count + 1):
+        job = "%s%s%04d" % (rng.choice(VERBS), rng.choice(NOUNS), app_id)
+        country = rng.choice(COUNTRIES)
+
+        if app_id % 20 == 0:
+            pattern_rows.append((app_id, "%s .* Rows \\d+" % job, False, ''))
+        else:
+            pattern_rows.append((app_id, "%sDailyAppTask %s Success" % (country, job), False, ''))
+
+    for i in range(email_count):
+        app_id, name_pattern = rng.choice(pattern_rows)[:2]
+
+        if i % 10 == 0:
+            subjects.append("Out of office: re %s" % rng.choice(NOUNS))
+        elif app_id % 20 == 0:
+            subjects.append("Batch App - %s finished Rows %d" % (name_pattern.split()[0], i))
+        else:
+            subjects.append("Batch App - %s %d/10/2014" % (name_pattern, rng.randint(1, 28)))
+
+    return pattern_rows, subjects
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--apps', type='int', dest='apps', default=1000),
+        make_option('--emails', type='int', dest='emails', default=5000),
+    )
+
+    def handle(self, *args, **options):
+        pattern_rows, subjects = generate_synthetic_corpus(options['apps'], options['emails'])
+        pattern_set = CompiledPatternSet(pattern_rows)
+        app_ids = [row[0] for row in pattern_rows]
+
+        start = time.time()
+        full_matches = [[app_id for app_id in app_ids if pattern_set.match(subject, app_id)]
+                        for subject in subjects]
+        full_seconds = time.time() - start
+
+        start = time.time()
+        indexed_matches = [pattern_set.match_apps(subject, app_ids) for subject in subjects]
+        indexed_seconds = time.time() - start
+
+        candidates = sum(len(pattern_set.filter_candidates(subject, app_ids)) for subject in subjects)
+
+        self.stdout.write('apps: %d, emails: %d' % (len(app_ids), len(subjects)))
+        self.stdout.write('candidate apps per email: %d without index, %.1f with index' % (
+            len(app_ids), float(candidates) / len(subjects)))
+        self.stdout.write('full scan: %.3fs, indexed: %.3fs' % (full_seconds, indexed_seconds))
+        self.stdout.write('results identical: %s' % (full_matches == indexed_matches))
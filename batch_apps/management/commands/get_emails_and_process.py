@@ -1,10 +1,11 @@
 from django.core.management.base import BaseCommand
-from django.core.management import call_command
-from batch_apps.integration import execute_end_to_end_tasks
+from batch_apps.integration import describe_report, execute_end_to_end_tasks, fetch_new_mail
 
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
-        call_command('getmail')
-        execute_end_to_end_tasks()
+        messages = fetch_new_mail()
+        self.stdout.write('%d emails fetched' % len(messages))
+        report = execute_end_to_end_tasks()
+        self.stdout.write(describe_report(report))
         self.stdout.write('get_emails_and_process command executed')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from batch_apps.models import Execution
+from batch_apps.generator import get_current_date_in_gmt8
+from optparse import make_option
+
+MATERIALIZE_DAYS_AHEAD = getattr(settings, 'BATCHER_MATERIALIZE_DAYS_AHEAD', 7)
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--days-ahead', type='int', dest='days_ahead', default=MATERIALIZE_DAYS_AHEAD),
+    )
+
+    def handle(self, *args, **options):
+        if options['days_ahead'] < 0:
+            raise CommandError('--days-ahead can not be negative')
+
+        report = Execution.objects.materialize(get_current_date_in_gmt8(), options['days_ahead'])
+        self.stdout.write('%d apps materialized, %d executions created, %d updated, %d removed' % (
+            report['apps'], report['created'], report['updated'], report['removed']))
+        self.stdout.write('materialize_executions command executed')
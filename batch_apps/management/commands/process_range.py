@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from batch_apps.integration import describe_report, execute_end_to_end_tasks_for_dates
+from batch_apps.generator import date_from_str
+from optparse import make_option
+import datetime
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='from', help='First day to process, as yyyy-mm-dd'),
+        make_option('--to', dest='to', help='Last day to process, as yyyy-mm-dd'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+                    help='Match and report without saving anything'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['from'] or not options['to']:
+            raise CommandError('Both --from and --to are required')
+
+        try:
+            start_date, end_date = date_from_str(options['from']), date_from_str(options['to'])
+        except ValueError as e:
+            raise CommandError('Invalid date: %s' % e)
+
+        if start_date > end_date:
+            raise CommandError('--from must not be after --to')
+
+        dates = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        report = execute_end_to_end_tasks_for_dates(dates, dry_run=options['dry_run'], progress=self.stdout.write)
+
+        self.stdout.write(describe_report(report))
+        if options['dry_run']:
+            self.stdout.write('dry run, no changes saved')
+        self.stdout.write('process_range command executed')
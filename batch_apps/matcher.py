@@ -1,56 +1,653 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from email.utils import parseaddr
 import datetime
 import re
+import signal
+import threading
+import time
+import unicodedata
+import uuid
 
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|')
+WORD_TOKEN = re.compile(r'\w+')
+DIGITS = re.compile(r'\d+')
+WHITESPACE = re.compile(r'\s+')
+SENDER_SEPARATORS = re.compile(r'[\s,;]+')
 
-def match_email_subject_to_app(subject, app):
-    pattern_list = app.pattern_set.filter(is_active=True)
+# Calls over the time budget that quarantine a pattern when no alarm could
+# interrupt them, so a single GC pause or preemption is not enough.
+PATTERN_OVERRUN_LIMIT = 3
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+MONTH_NAME_REGEX = (r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|'
+                    r'sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?')
+
+# Every shape has exactly three groups, so the shape of a match can be
+# derived from match.lastindex without any further searching.
+DATE_SHAPES = ['iso', 'slash', 'noslash', 'dash', 'dot', 'day_month_name', 'month_name_day']
+DATE_SCANNER = re.compile('|'.join([
+    r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b',
+    r'(\d{1,2})/(\d{1,2})/(\d{4})',
+    r'(\d{2})(\d{2})/(\d{4})',
+    r'(\d{1,2})-(\d{1,2})-(\d{4})',
+    r'(\d{1,2})\.(\d{1,2})\.(\d{4})',
+    r'\b(\d{1,2})(?:st|nd|rd|th)?[ -]' + MONTH_NAME_REGEX + r'[ ,-]+(\d{4})',
+    r'\b' + MONTH_NAME_REGEX + r' (\d{1,2})(?:st|nd|rd|th)?,? (\d{4})',
+]), re.IGNORECASE)
+
+DATE_FORMATS = {
+    'dd/mm/yyyy': ('slash', ('day', 'month', 'year')),
+    'mm/dd/yyyy': ('slash', ('month', 'day', 'year')),
+    'ddmm/yyyy': ('noslash', ('day', 'month', 'year')),
+    'mmdd/yyyy': ('noslash', ('month', 'day', 'year')),
+    'yyyy-mm-dd': ('iso', ('year', 'month', 'day')),
+    'dd-mm-yyyy': ('dash', ('day', 'month', 'year')),
+    'dd.mm.yyyy': ('dot', ('day', 'month', 'year')),
+    'dd mon yyyy': ('day_month_name', ('day', 'month', 'year')),
+    'mon dd yyyy': ('month_name_day', ('month', 'day', 'year')),
+}
+
+
+PatternRow = namedtuple('PatternRow', ['app_id', 'name_pattern', 'is_capturing_date', 'date_pattern',
+                                       'id', 'is_quarantined', 'is_case_insensitive', 'kind', 'compiled_pattern', 'target'])
+PatternRow.__new__.__defaults__ = (None, False, False, None, None, 'subject')
+
+
+class PatternTimeout(Exception):
+    pass
+
+
+class PatternStats(object):
+
+    def __init__(self):
+        self.by_pattern = {}
+        self.quarantined = set()
+
+    def record(self, pattern_id, is_hit, seconds):
+        stats = self.by_pattern.setdefault(pattern_id, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += int(is_hit)
+        stats[2] += seconds
+
+    def merge(self, other):
+        for pattern_id, (match_count, hit_count, match_time) in other.by_pattern.items():
+            stats = self.by_pattern.setdefault(pattern_id, [0, 0, 0.0])
+            stats[0] += match_count
+            stats[1] += hit_count
+            stats[2] += match_time
+
+        self.quarantined.update(other.quarantined)
+
+
+class CompiledPatternSet(object):
+
+    def __init__(self, pattern_rows, time_budget=None, case_insensitive=False):
+        self._patterns_by_app = {}
+        self._content_patterns_by_app = {}
+        self.time_budget = time_budget
+        self.case_insensitive = case_insensitive
+        self.stats = PatternStats()
+        self._alarm_armed = False
+        self._overruns = {}
+        index_keys_by_app = {}
+
+        for row in pattern_rows:
+            row = PatternRow(*row)
+            pattern_id = row.id if row.id is not None else (row.app_id, row.name_pattern)
+            date_pattern = row.date_pattern if row.is_capturing_date else ''
+
+            try:
+                kind, needle = self._compile_row(row)
+            except re.error:
+                kind, needle = 'regex', None
+                self.stats.quarantined.add(pattern_id)
+
+            if row.is_quarantined:
+                self.stats.quarantined.add(pattern_id)
+
+            if row.target == 'content':
+                self._content_patterns_by_app.setdefault(row.app_id, []).append((pattern_id, kind, needle))
+                continue
+
+            self._patterns_by_app.setdefault(row.app_id, []).append((pattern_id, kind, needle, date_pattern))
+            index_keys_by_app.setdefault(row.app_id, [])
+
+            if kind == 'literal':
+                index_keys_by_app[row.app_id].extend(('subject',) + key for key in extract_index_keys(needle))
+            elif kind == 'iliteral':
+                index_keys_by_app[row.app_id].extend(('normalized',) + key for key in extract_index_keys(needle))
+
+        self._build_token_index(index_keys_by_app)
+        self.content_app_ids = set(self._content_patterns_by_app)
+        self.date_capturing_app_ids = set(app_id for app_id, patterns in self._patterns_by_app.items()
+                                          if any(date_pattern for pattern_id, kind, needle, date_pattern in patterns))
+        self._uses_normalized_subject = any(kind == 'iliteral' for patterns in self._patterns_by_app.values()
+                                            for pattern_id, kind, needle, date_pattern in patterns)
+
+        # Apps whose patterns are digit-free literals give the same result
+        # for a subject and for its fingerprint, so only their matches can
+        # be cached per fingerprint.
+        self._fingerprint_stable_app_ids = set(
+            app_id for app_id, patterns in self._patterns_by_app.items()
+            if all(kind != 'regex' and not date_pattern and pattern_id not in self.stats.quarantined and
+                   '#' not in needle and DIGITS.search(needle) is None
+                   for pattern_id, kind, needle, date_pattern in patterns))
+
+    def reset_stats(self):
+        # Quarantined patterns stay skipped, only the counts start over
+        quarantined = self.stats.quarantined
+        self.stats = PatternStats()
+        self.stats.quarantined.update(quarantined)
+
+    def _compile_row(self, row):
+        if not row.compiled_pattern:
+            kind, compiled_pattern = compile_pattern(row.name_pattern, row.is_case_insensitive)
+        else:
+            kind, compiled_pattern = row.kind, row.compiled_pattern
+
+        if kind == 'regex':
+            flags = re.IGNORECASE if row.is_case_insensitive or self.case_insensitive else 0
+            return kind, re.compile(compiled_pattern, flags)
+
+        if kind == 'literal' and self.case_insensitive:
+            return 'iliteral', normalize_subject(compiled_pattern, strip=False)
+
+        return kind, compiled_pattern
+
+    def _build_token_index(self, index_keys_by_app):
+        self._token_index = {
+            'subject': {'exact': {}, 'prefix': {}, 'suffix': {}},
+            'normalized': {'exact': {}, 'prefix': {}, 'suffix': {}},
+        }
+        self._indexed_app_ids = set()
+
+        key_frequency = {}
+        for keys in index_keys_by_app.values():
+            for key in set(keys):
+                key_frequency[key] = key_frequency.get(key, 0) + 1
+
+        # Every active pattern of an app must match, so any one of its keys
+        # is required; index each app under its most selective key only.
+        for app_id, keys in index_keys_by_app.items():
+            if not keys:
+                continue
+
+            source, kind, token = min(keys, key=lambda key: (key_frequency[key], -len(key[2])))
+            self._token_index[source][kind].setdefault(token, set()).add(app_id)
+            self._indexed_app_ids.add(app_id)
+
+    def candidate_app_ids(self, subject, normalized_subject=None):
+        candidates = set()
+
+        for source, text in (('subject', subject), ('normalized', normalized_subject)):
+            exact, prefix, suffix = (self._token_index[source]['exact'],
+                                     self._token_index[source]['prefix'],
+                                     self._token_index[source]['suffix'])
+
+            if not (exact or prefix or suffix):
+                continue
+
+            if text is None:
+                text = normalize_subject(subject)
+
+            for token in set(WORD_TOKEN.findall(text)):
+                candidates.update(exact.get(token, ()))
+
+                for i in range(1, len(token) + 1):
+                    if prefix:
+                        candidates.update(prefix.get(token[:i], ()))
+                    if suffix:
+                        candidates.update(suffix.get(token[-i:], ()))
+
+        return candidates
+
+    @contextmanager
+    def time_budget_guard(self):
+        # Catastrophic backtracking can only be interrupted by a signal, and
+        # signal handlers can only be installed from the main thread.
+        if (self.time_budget is None or not hasattr(signal, 'setitimer') or
+                threading.current_thread() is not threading.main_thread()):
+            yield
+            return
+
+        previous_handler = signal.signal(signal.SIGALRM, _raise_pattern_timeout)
+        self._alarm_armed = True
+        try:
+            yield
+        finally:
+            self._alarm_armed = False
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    def _search(self, pattern_id, regex, subject):
+        if pattern_id in self.stats.quarantined:
+            return False
+
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            if self._alarm_armed:
+                signal.setitimer(signal.ITIMER_REAL, self.time_budget)
+            is_hit = regex.search(subject) is not None
+            if self._alarm_armed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except PatternTimeout:
+            is_hit = False
+            timed_out = True
+
+        elapsed = time.perf_counter() - start
+        self.stats.record(pattern_id, is_hit, elapsed)
+
+        if self.time_budget is not None and elapsed >= self.time_budget:
+            self._overruns[pattern_id] = self._overruns.get(pattern_id, 0) + 1
+
+        if timed_out or self._overruns.get(pattern_id, 0) >= PATTERN_OVERRUN_LIMIT:
+            self.stats.quarantined.add(pattern_id)
+            return False
+
+        return is_hit
+
+    def _find_literal(self, pattern_id, needle, subject):
+        if pattern_id in self.stats.quarantined:
+            return False
+
+        start = time.perf_counter()
+        is_hit = needle in subject
+        self.stats.record(pattern_id, is_hit, time.perf_counter() - start)
+        return is_hit
+
+    def match(self, subject, app_id, normalized_subject=None):
+        for pattern_id, kind, needle, date_pattern in self._patterns_by_app.get(app_id, ()):
+            if kind == 'literal':
+                is_hit = self._find_literal(pattern_id, needle, subject)
+
+            elif kind == 'iliteral':
+                if normalized_subject is None:
+                    normalized_subject = normalize_subject(subject)
+                is_hit = self._find_literal(pattern_id, needle, normalized_subject)
+
+            else:
+                is_hit = self._search(pattern_id, needle, subject)
+
+            if not is_hit:
+                return False
+
+            if date_pattern and capture_date(subject, date_pattern) is None:
+                return False
+
+        return True
+
+    def captured_date(self, subject, app_id):
+        for pattern_id, kind, needle, date_pattern in self._patterns_by_app.get(app_id, ()):
+            if date_pattern:
+                captured = capture_date(subject, date_pattern)
+
+                if captured is not None:
+                    return datetime.datetime.strptime(captured, '%Y-%m-%d').date()
+
+        return None
+
+    def match_content(self, content, app_id):
+        normalized_content = None
+
+        for pattern_id, kind, needle in self._content_patterns_by_app.get(app_id, ()):
+            if kind == 'literal':
+                is_hit = self._find_literal(pattern_id, needle, content)
+
+            elif kind == 'iliteral':
+                if normalized_content is None:
+                    normalized_content = normalize_subject(content)
+                is_hit = self._find_literal(pattern_id, needle, normalized_content)
+
+            else:
+                is_hit = self._search(pattern_id, needle, content)
+
+            if not is_hit:
+                return False
+
+        return True
+
+    def filter_candidates(self, subject, app_ids, normalized_subject=None):
+        candidates = self.candidate_app_ids(subject, normalized_subject)
+
+        return [app_id for app_id in app_ids
+                if app_id in candidates or app_id not in self._indexed_app_ids]
+
+    def fingerprint(self, subject):
+        # Results differ between matching modes, so they are cached apart.
+        return ('i:' if self.case_insensitive else '') + subject_fingerprint(subject)
+
+    def match_apps(self, subject, app_ids, fingerprint_cache=None, normalized_subject=None):
+        if not normalized_subject and self._uses_normalized_subject:
+            normalized_subject = normalize_subject(subject)
+
+        if fingerprint_cache is None:
+            return [app_id for app_id in self.filter_candidates(subject, app_ids, normalized_subject)
+                    if self.match(subject, app_id, normalized_subject)]
+
+        fingerprint = self.fingerprint(subject)
+        stable_matches = fingerprint_cache.get(fingerprint)
+
+        if stable_matches is None:
+            stable_matches = set(self.match_apps(subject, self._fingerprint_stable_app_ids,
+                                                 normalized_subject=normalized_subject))
+            fingerprint_cache.store(fingerprint, stable_matches)
+
+        candidates = set(self.filter_candidates(subject, app_ids, normalized_subject))
+
+        return [app_id for app_id in app_ids
+                if (app_id in stable_matches if app_id in self._fingerprint_stable_app_ids else
+                    app_id in candidates and self.match(subject, app_id, normalized_subject))]
+
+
+class SenderIndex(object):
+
+    def __init__(self, app_senders):
+        self._app_ids_by_sender = {}
+        self._restricted_app_ids = set()
 
-    results = []
-    for pattern in pattern_list:
-        results.append(match_subject(pattern, subject))
+        for app_id, senders in app_senders:
+            for sender in parse_senders(senders):
+                self._app_ids_by_sender.setdefault(sender, set()).add(app_id)
+                self._restricted_app_ids.add(app_id)
 
-        if pattern.is_capturing_date and pattern.date_pattern is not "":
-            results.append(capture_date(subject, pattern.date_pattern))
+    def filter_app_ids(self, sender_address, app_ids):
+        # Messages without a parsed sender cannot be attributed to a host,
+        # so they are still matched against every app.
+        if not sender_address or not self._restricted_app_ids:
+            return app_ids
 
-    return all(results)
+        domain = sender_address.rpartition('@')[2]
+        allowed = self._app_ids_by_sender.get(sender_address, set()) | self._app_ids_by_sender.get(domain, set())
+
+        return [app_id for app_id in app_ids if app_id in allowed or app_id not in self._restricted_app_ids]
+
+
+class FingerprintCache(object):
+
+    def __init__(self, entries=None, signature=None):
+        self.entries = dict(entries or {})
+        self.new_entries = {}
+        self.signature = signature
+        self.looked_up = set(self.entries)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        app_ids = self.entries.get(fingerprint)
+
+        if app_ids is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return app_ids
+
+    def store(self, fingerprint, app_ids):
+        self.entries[fingerprint] = app_ids
+        self.new_entries[fingerprint] = app_ids
+
+    def reset_counts(self):
+        self.hits = 0
+        self.misses = 0
+
+    def merge(self, other):
+        self.entries.update(other.new_entries)
+        self.new_entries.update(other.new_entries)
+        self.hits += other.hits
+        self.misses += other.misses
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+
+def subject_fingerprint(subject):
+    return DIGITS.sub('#', subject)
+
+
+def normalize_subject(subject, strip=True):
+    normalized = WHITESPACE.sub(' ', unicodedata.normalize('NFKC', subject).casefold())
+    return normalized.strip() if strip else normalized
+
+
+def parse_sender_address(from_header):
+    return parseaddr(from_header)[1].lower()
+
+
+def parse_senders(senders):
+    return [sender.lstrip('@').lower() for sender in SENDER_SEPARATORS.split(senders) if sender.lstrip('@')]
+
+
+class SubjectMatcher(object):
+
+    def __init__(self, pattern_rows, app_senders=(), processes=None, chunk_size=2000, pattern_set=None,
+                 sender_index=None, **pattern_set_options):
+        # Every chunk of a run is matched with the same compiled pattern set
+        # and, with several processes, the same pool of workers, so patterns
+        # quarantined in one chunk stay quarantined for the rest of the run.
+        self.pattern_rows = list(pattern_rows)
+        self.app_senders = list(app_senders)
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+        if pattern_set is None:
+            pattern_set = CompiledPatternSet(self.pattern_rows, **pattern_set_options)
+
+        if sender_index is None:
+            sender_index = SenderIndex(self.app_senders)
+
+        self.pattern_set = pattern_set
+        self.sender_index = sender_index
+        self._run_key = uuid.uuid4().hex
+        self._executor = None
+
+    @property
+    def stats(self):
+        return self.pattern_set.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def match(self, subjects, app_ids, fingerprint_cache=None, normalized_subjects=None, sender_addresses=None):
+        app_ids = list(app_ids)
+
+        if normalized_subjects is None:
+            normalized_subjects = [None] * len(subjects)
+
+        if sender_addresses is None:
+            sender_addresses = [None] * len(subjects)
+
+        if not self.processes or self.processes < 2 or len(subjects) <= self.chunk_size:
+            with self.pattern_set.time_budget_guard():
+                return _match_subjects(self.pattern_set, self.sender_index, subjects, normalized_subjects,
+                                       sender_addresses, app_ids, fingerprint_cache)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+
+        pattern_set_options = {'time_budget': self.pattern_set.time_budget,
+                               'case_insensitive': self.pattern_set.case_insensitive}
+        futures = []
+
+        for i in range(0, len(subjects), self.chunk_size):
+            chunk_subjects = subjects[i:i + self.chunk_size]
+            chunk_fingerprint_cache = None
+
+            # Workers only receive the cached entries their own subjects can hit
+            if fingerprint_cache is not None:
+                fingerprints = set(self.pattern_set.fingerprint(subject) for subject in chunk_subjects)
+                chunk_fingerprint_cache = FingerprintCache((fingerprint, fingerprint_cache.entries[fingerprint])
+                                                           for fingerprint in fingerprints
+                                                           if fingerprint in fingerprint_cache.entries)
+
+            futures.append(self._executor.submit(_match_subjects_in_worker,
+                                                 self._run_key,
+                                                 self.pattern_rows,
+                                                 self.app_senders,
+                                                 pattern_set_options,
+                                                 set(self.stats.quarantined),
+                                                 chunk_subjects,
+                                                 normalized_subjects[i:i + self.chunk_size],
+                                                 sender_addresses[i:i + self.chunk_size],
+                                                 app_ids,
+                                                 chunk_fingerprint_cache))
+
+        match_matrix = []
+        for future in futures:
+            chunk_matrix, chunk_stats, chunk_fingerprint_cache = future.result()
+            match_matrix.extend(chunk_matrix)
+            self.stats.merge(chunk_stats)
+
+            if fingerprint_cache is not None:
+                fingerprint_cache.merge(chunk_fingerprint_cache)
+
+        return match_matrix
+
+
+def match_subjects(subjects, pattern_rows, app_ids, processes=None, chunk_size=2000, stats=None,
+                   fingerprint_cache=None, normalized_subjects=None, sender_addresses=None, app_senders=(),
+                   **pattern_set_options):
+    with SubjectMatcher(pattern_rows, app_senders, processes, chunk_size, **pattern_set_options) as matcher:
+        match_matrix = matcher.match(subjects, app_ids, fingerprint_cache, normalized_subjects, sender_addresses)
+
+    if stats is not None:
+        stats.merge(matcher.stats)
+
+    return match_matrix
+
+
+def _match_subjects(pattern_set, sender_index, subjects, normalized_subjects, sender_addresses, app_ids,
+                    fingerprint_cache):
+    return [pattern_set.match_apps(subject, sender_index.filter_app_ids(sender_address, app_ids),
+                                   fingerprint_cache, normalized_subject)
+            for subject, normalized_subject, sender_address in zip(subjects, normalized_subjects, sender_addresses)]
+
+
+_worker_state = {}
+
+
+def _match_subjects_in_worker(run_key, pattern_rows, app_senders, pattern_set_options, quarantined, subjects,
+                              normalized_subjects, sender_addresses, app_ids, fingerprint_cache):
+    # A worker compiles the pattern set once per run and reports the stats
+    # of each task separately; quarantines carry over to its later tasks.
+    if _worker_state.get('run_key') != run_key:
+        _worker_state.update(run_key=run_key,
+                             pattern_set=CompiledPatternSet(pattern_rows, **pattern_set_options),
+                             sender_index=SenderIndex(app_senders))
+
+    pattern_set = _worker_state['pattern_set']
+    pattern_set.reset_stats()
+    pattern_set.stats.quarantined.update(quarantined)
+
+    with pattern_set.time_budget_guard():
+        match_matrix = _match_subjects(pattern_set, _worker_state['sender_index'], subjects, normalized_subjects,
+                                       sender_addresses, app_ids, fingerprint_cache)
+
+    return match_matrix, pattern_set.stats, fingerprint_cache
+
+
+def _raise_pattern_timeout(signum, frame):
+    raise PatternTimeout()
+
+
+def compile_pattern(name_pattern, is_case_insensitive=False):
+    if not REGEX_METACHARACTERS.intersection(name_pattern):
+        if is_case_insensitive:
+            return 'iliteral', normalize_subject(name_pattern, strip=False)
+        return 'literal', name_pattern
+
+    compiled_pattern = escape_parentheses(name_pattern)
+    re.compile(compiled_pattern)
+    return 'regex', compiled_pattern
+
+
+def extract_index_keys(name_pattern):
+    if REGEX_METACHARACTERS.intersection(name_pattern):
+        return []
+
+    # A literal pattern can start or end in the middle of a subject word, so
+    # only the sides of a token that are bounded within the pattern itself
+    # are guaranteed to be word boundaries in a matching subject.
+    keys = []
+    for token in WORD_TOKEN.finditer(name_pattern):
+        bounded_left = token.start() > 0
+        bounded_right = token.end() < len(name_pattern)
+
+        if bounded_left and bounded_right:
+            keys.append(('exact', token.group()))
+        elif bounded_left:
+            keys.append(('prefix', token.group()))
+        elif bounded_right:
+            keys.append(('suffix', token.group()))
+
+    return keys
+
+
+def match_email_subject_to_app(subject, app):
+    pattern_set = CompiledPatternSet(app.pattern_set.active_pattern_rows())
+    return pattern_set.match(str(subject), app.id)
 
 
 def match_subject(regex, text):
-    regex = str(regex).replace("(", "\\(").replace(")", "\\)")
-    return bool(re.search(str(regex), str(text)))
+    return bool(re.search(escape_parentheses(str(regex)), str(text)))
+
+
+def escape_parentheses(regex):
+    return regex.replace("(", "\\(").replace(")", "\\)")
 
 
 def capture_date(text, supplied_date_pattern="dd/mm/yyyy"):
-    regex_noslash = '(\d{4}/\d{4})'
-    regex_slash = '(\d{1,2}/\d{1,2}/\d{4})'
+    supplied_date_pattern = re.sub('[()]', '', supplied_date_pattern)
 
+    if supplied_date_pattern not in DATE_FORMATS:
+        return
+
+    return _capture_date_from_scan(scan_dates(text), supplied_date_pattern)
+
+
+def capture_dates(texts, supplied_date_pattern="dd/mm/yyyy"):
     supplied_date_pattern = re.sub('[()]', '', supplied_date_pattern)
 
-    if supplied_date_pattern == "dd/mm/yyyy":
-        regex = regex_slash
-        extraction_format = "%d/%m/%Y"
+    if supplied_date_pattern not in DATE_FORMATS:
+        return [None] * len(texts)
 
-    elif supplied_date_pattern == "mm/dd/yyyy":
-        regex = regex_slash
-        extraction_format = "%m/%d/%Y"
+    return [_capture_date_from_scan(scan_dates(text), supplied_date_pattern) for text in texts]
 
-    elif supplied_date_pattern == "ddmm/yyyy":
-        regex = regex_noslash
-        extraction_format = "%d%m/%Y"
 
-    elif supplied_date_pattern == "mmdd/yyyy":
-        regex = regex_noslash
-        extraction_format = "%m%d/%Y"
+def scan_dates(text):
+    return [(DATE_SHAPES[(m.lastindex - 1) // 3], m.group(m.lastindex - 2, m.lastindex - 1, m.lastindex))
+            for m in DATE_SCANNER.finditer(text)]
 
-    else:
-        return
 
-    m = re.search(regex, text)
+def _capture_date_from_scan(scanned_dates, supplied_date_pattern):
+    shape, field_order = DATE_FORMATS[supplied_date_pattern]
 
-    if bool(m) is True:
-        try:
-            extracted_date = datetime.datetime.strptime(m.group(1), extraction_format)
-            return extracted_date.strftime("%Y-%m-%d")
+    for scanned_shape, values in scanned_dates:
+        if scanned_shape == shape:
+            fields = dict(zip(field_order, values))
+            try:
+                return datetime.date(int(fields['year']),
+                                     _month_number(fields['month']),
+                                     int(fields['day'])).isoformat()
+            except ValueError:
+                return None
+
+
+def _month_number(month):
+    if month.isdigit():
+        return int(month)
+
+    return MONTH_NAMES.index(month[:3].lower()) + 1
 
-        except:
-            return None
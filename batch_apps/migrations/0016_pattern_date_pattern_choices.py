@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0015_execution_email_blank'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pattern',
+            name='date_pattern',
+            field=models.CharField(blank=True, default='', choices=[('', ''), ('dd/mm/yyyy', 'dd/mm/yyyy'), ('mm/dd/yyyy', 'mm/dd/yyyy'), ('ddmm/yyyy', 'ddmm/yyyy'), ('mmdd/yyyy', 'mmdd/yyyy'), ('yyyy-mm-dd', 'yyyy-mm-dd'), ('dd-mm-yyyy', 'dd-mm-yyyy'), ('dd.mm.yyyy', 'dd.mm.yyyy'), ('dd mon yyyy', 'dd mon yyyy'), ('mon dd yyyy', 'mon dd yyyy')], max_length=64),
+        ),
+    ]
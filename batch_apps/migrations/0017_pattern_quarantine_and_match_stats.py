@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0016_pattern_date_pattern_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pattern',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='pattern',
+            name='is_quarantined',
+            field=models.BooleanField(default=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='pattern',
+            name='match_count',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='pattern',
+            name='match_time',
+            field=models.FloatField(default=0.0),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import re
+
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|')
+
+
+# Frozen copy of batch_apps.matcher.compile_pattern as of this migration;
+# is_case_insensitive is only added here, so every pattern is case-sensitive.
+def compile_pattern(name_pattern):
+    if not REGEX_METACHARACTERS.intersection(name_pattern):
+        return 'literal', name_pattern
+
+    compiled_pattern = name_pattern.replace("(", "\\(").replace(")", "\\)")
+    re.compile(compiled_pattern)
+    return 'regex', compiled_pattern
+
+
+def compile_existing_patterns(apps, schema_editor):
+    Pattern = apps.get_model('batch_apps', 'Pattern')
+
+    for pattern in Pattern.objects.all():
+        try:
+            pattern.kind, pattern.compiled_pattern = compile_pattern(pattern.name_pattern)
+        except re.error:
+            pattern.is_quarantined = True
+        pattern.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0017_pattern_quarantine_and_match_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pattern',
+            name='compiled_pattern',
+            field=models.CharField(default='', max_length=256, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='pattern',
+            name='is_case_insensitive',
+            field=models.BooleanField(default=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='pattern',
+            name='kind',
+            field=models.CharField(default='regex', max_length=16, choices=[('literal', 'literal'), ('iliteral', 'case-insensitive literal'), ('regex', 'regex')], editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(compile_existing_patterns, lambda apps, schema_editor: None),
+    ]
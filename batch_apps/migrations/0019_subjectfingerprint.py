@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0018_pattern_compiled_pattern'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectFingerprint',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('fingerprint', models.CharField(unique=True, max_length=255)),
+                ('app_ids', models.TextField(default='', blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
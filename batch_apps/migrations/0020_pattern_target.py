@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0019_subjectfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pattern',
+            name='target',
+            field=models.CharField(default='subject', max_length=16, choices=[('subject', 'subject'), ('content', 'text/plain content')]),
+            preserve_default=True,
+        ),
+    ]
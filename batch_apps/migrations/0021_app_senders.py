@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0020_pattern_target'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='app',
+            name='senders',
+            field=models.TextField(default='', max_length=500, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mailbox', '0005_message_sender_address'),
+        ('batch_apps', '0021_app_senders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingCursor',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('last_message_id', models.PositiveIntegerField(default=0)),
+                ('mailbox', models.OneToOneField(to='django_mailbox.Mailbox')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
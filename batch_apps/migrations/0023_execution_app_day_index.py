@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0022_processingcursor'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='execution',
+            index_together=set([('app', 'day')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0023_execution_app_day_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RematchRequest',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('app', models.ForeignKey(to='batch_apps.App')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def delete_duplicate_executions(apps, schema_editor):
+    # Keeps the executed row of each (day, app), or else the oldest one
+    Execution = apps.get_model('batch_apps', 'Execution')
+    kept = set()
+
+    for execution_id, day_id, app_id in (Execution.objects.order_by('-is_executed', 'id')
+                                         .values_list('id', 'day_id', 'app_id').iterator()):
+        if (day_id, app_id) in kept:
+            Execution.objects.filter(pk=execution_id).delete()
+        else:
+            kept.add((day_id, app_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0025_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_executions, lambda apps, schema_editor: None),
+        migrations.AlterUniqueTogether(
+            name='execution',
+            unique_together=set([('day', 'app')]),
+        ),
+    ]
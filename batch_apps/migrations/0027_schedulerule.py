@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0026_execution_unique_day_app'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleRule',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=32, choices=[('weekdays', 'weekdays'), ('days_of_month', 'days of month'), ('last_business_day', 'last business day'), ('every_n_days', 'every N days'), ('exclude_dates', 'exclude dates')])),
+                ('value', models.CharField(default='', max_length=500, blank=True)),
+                ('start_date', models.DateField(null=True, blank=True)),
+                ('app', models.ForeignKey(to='batch_apps.App')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
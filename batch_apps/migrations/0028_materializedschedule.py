@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0027_schedulerule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterializedSchedule',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('signature', models.CharField(max_length=40)),
+                ('materialized_until', models.DateField()),
+                ('app', models.OneToOneField(to='batch_apps.App')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
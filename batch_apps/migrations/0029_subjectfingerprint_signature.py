@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_apps', '0028_materializedschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subjectfingerprint',
+            name='signature',
+            field=models.CharField(default='', max_length=40),
+            preserve_default=True,
+        ),
+    ]
@@ -1,5 +1,16 @@
-from django.db import models
-from django_mailbox.models import Message
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+from django_mailbox.models import Mailbox, Message
+from batch_apps.matcher import FingerprintCache, PatternRow, compile_pattern
+from batch_apps.schedule import EXCLUDE_DATES, compile_rule, compile_schedule, due_dates_by_app, iter_dates, parse_dates
+import datetime
+import hashlib
+import os
+import re
+import socket
+import uuid
 
 DATE_PATTERNS = (
     ('', ''),
@@ -7,6 +18,11 @@ DATE_PATTERNS = (
     ('mm/dd/yyyy', 'mm/dd/yyyy'),
     ('ddmm/yyyy',  'ddmm/yyyy'),
     ('mmdd/yyyy',  'mmdd/yyyy'),
+    ('yyyy-mm-dd', 'yyyy-mm-dd'),
+    ('dd-mm-yyyy', 'dd-mm-yyyy'),
+    ('dd.mm.yyyy', 'dd.mm.yyyy'),
+    ('dd mon yyyy', 'dd mon yyyy'),
+    ('mon dd yyyy', 'mon dd yyyy'),
 )
 
 FREQUENCY_CHOICES = (
@@ -21,6 +37,40 @@ FREQUENCY_CHOICES = (
     ('monthly - day 01',   'monthly - day 01'),
 )
 
+SQLITE_MAX_VARIABLES = 900
+
+# Bulk inserts that lose a race to another request are worked out again this
+# many times before the IntegrityError is raised.
+BULK_INSERT_ATTEMPTS = 3
+
+# Literal rather than parameterised so that SQLite can match them against the
+# partial indexes created in django_mailbox migrations 0006 and 0007.
+UNPROCESSED_MESSAGE_CONDITION = ['NOT processed_batch_apps', 'NOT matched_batch_apps']
+PROCESSED_UNMATCHED_MESSAGE_CONDITION = ['processed_batch_apps', 'NOT matched_batch_apps']
+
+# Scheduled runs process today and the previous day, so messages dated
+# further back are only picked up by reprocessing those days explicitly.
+CURSOR_LOOK_BACK_DAYS = 1
+
+PATTERN_KIND_CHOICES = (
+    ('literal', 'literal'),
+    ('iliteral', 'case-insensitive literal'),
+    ('regex', 'regex'),
+)
+
+PATTERN_TARGET_CHOICES = (
+    ('subject', 'subject'),
+    ('content', 'text/plain content'),
+)
+
+SCHEDULE_RULE_KIND_CHOICES = (
+    ('weekdays', 'weekdays'),
+    ('days_of_month', 'days of month'),
+    ('last_business_day', 'last business day'),
+    ('every_n_days', 'every N days'),
+    (EXCLUDE_DATES, 'exclude dates'),
+)
+
 COUNTRY_CHOICES = (
     ('MY', 'MY'),
     ('SG', 'SG'),
@@ -41,11 +91,29 @@ class App(models.Model):
     repo = models.CharField(max_length=128, default='', blank=True)
     country = models.CharField(max_length=16, choices=COUNTRY_CHOICES, default='', blank=True)
     category = models.CharField(max_length=16, choices=APP_CATEGORY_CHOICES, default='', blank=True)
+    senders = models.TextField(max_length=500, default='', blank=True)
 
     def __str__(self):
         return self.name
 
 
+class PatternManager(models.Manager):
+
+    def active_pattern_rows(self):
+        return self.filter(is_active=True).values_list(*PatternRow._fields)
+
+    def record_match_stats(self, stats):
+        with transaction.atomic():
+            for pattern_id, (match_count, hit_count, match_time) in stats.by_pattern.items():
+                self.filter(pk=pattern_id).update(match_count=F('match_count') + match_count,
+                                                  hit_count=F('hit_count') + hit_count,
+                                                  match_time=F('match_time') + match_time)
+
+            quarantined = list(stats.quarantined)
+            for i in range(0, len(quarantined), SQLITE_MAX_VARIABLES):
+                self.filter(pk__in=quarantined[i:i + SQLITE_MAX_VARIABLES]).update(is_quarantined=True)
+
+
 class Pattern(models.Model):
 
     app = models.ForeignKey(App)
@@ -53,10 +121,298 @@ class Pattern(models.Model):
     is_capturing_date = models.BooleanField(default=False)
     date_pattern = models.CharField(max_length=64, choices=DATE_PATTERNS, default='', blank=True)
     is_active = models.BooleanField(default=False)
+    is_case_insensitive = models.BooleanField(default=False)
+    target = models.CharField(max_length=16, choices=PATTERN_TARGET_CHOICES, default='subject')
+    kind = models.CharField(max_length=16, choices=PATTERN_KIND_CHOICES, default='regex', editable=False)
+    compiled_pattern = models.CharField(max_length=256, default='', editable=False)
+    is_quarantined = models.BooleanField(default=False)
+    match_count = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    match_time = models.FloatField(default=0.0)
+
+    objects = PatternManager()
 
     def __str__(self):
         return self.name_pattern
 
+    def clean(self):
+        try:
+            compile_pattern(self.name_pattern, self.is_case_insensitive)
+        except re.error as e:
+            raise ValidationError({'name_pattern': 'Invalid regular expression: %s' % e})
+
+    def save(self, *args, **kwargs):
+        self.kind, self.compiled_pattern = compile_pattern(self.name_pattern, self.is_case_insensitive)
+        super(Pattern, self).save(*args, **kwargs)
+
+
+class ScheduleRuleManager(models.Manager):
+
+    def schedule_keys_by_app(self, apps):
+        app_ids = [app.id for app in apps]
+        rule_rows_by_app = {}
+
+        for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES):
+            rules = self.filter(app_id__in=app_ids[i:i + SQLITE_MAX_VARIABLES]).order_by('id')
+
+            for row in rules.values_list('app_id', 'kind', 'value', 'start_date'):
+                rule_rows_by_app.setdefault(row[0], []).append(row[1:])
+
+        return dict((app.id, (app.frequency, tuple(rule_rows_by_app.get(app.id, ())))) for app in apps)
+
+    def schedules_by_app(self, apps):
+        return dict((app_id, compile_schedule(*key)) for app_id, key in self.schedule_keys_by_app(apps).items())
+
+    def signatures_by_app(self, apps):
+        return dict((app_id, hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+                    for app_id, key in self.schedule_keys_by_app(apps).items())
+
+
+class ScheduleRule(models.Model):
+
+    app = models.ForeignKey(App)
+    kind = models.CharField(max_length=32, choices=SCHEDULE_RULE_KIND_CHOICES)
+    value = models.CharField(max_length=500, default='', blank=True)
+    start_date = models.DateField(null=True, blank=True)
+
+    objects = ScheduleRuleManager()
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.value)
+
+    def clean(self):
+        try:
+            if self.kind == EXCLUDE_DATES:
+                parse_dates(self.value)
+            else:
+                compile_rule(self.kind, self.value, self.start_date)
+        except ValueError as e:
+            raise ValidationError({'value': str(e)})
+
+
+class MaterializedSchedule(models.Model):
+
+    app = models.OneToOneField(App)
+    signature = models.CharField(max_length=40)
+    materialized_until = models.DateField()
+
+    def __str__(self):
+        return '%s: %s' % (self.app, self.materialized_until)
+
+
+class SubjectFingerprintManager(models.Manager):
+
+    def current_signature(self, pattern_rows=None):
+        if pattern_rows is None:
+            pattern_rows = list(Pattern.objects.active_pattern_rows().order_by('id'))
+        return hashlib.sha1(repr(pattern_rows).encode('utf-8')).hexdigest()
+
+    def load_cache(self, pattern_rows=None):
+        return FingerprintCache(signature=self.current_signature(pattern_rows))
+
+    def load_entries(self, fingerprint_cache, fingerprints):
+        # Only the fingerprints of the subjects at hand are read, so a run
+        # never loads the whole table.
+        fingerprints = [fingerprint for fingerprint in set(fingerprints)
+                        if fingerprint not in fingerprint_cache.looked_up]
+        fingerprint_cache.looked_up.update(fingerprints)
+
+        for i in range(0, len(fingerprints), SQLITE_MAX_VARIABLES):
+            entries = self.filter(signature=fingerprint_cache.signature,
+                                  fingerprint__in=fingerprints[i:i + SQLITE_MAX_VARIABLES])
+
+            for fingerprint, app_ids in entries.values_list('fingerprint', 'app_ids'):
+                fingerprint_cache.entries[fingerprint] = set(int(app_id) for app_id in app_ids.split(',') if app_id)
+
+    def save_cache(self, fingerprint_cache):
+        # Entries computed with patterns that changed during the run are
+        # dropped instead of overwriting the invalidation.
+        with transaction.atomic():
+            signature = self.current_signature()
+            if fingerprint_cache.signature != signature:
+                return
+
+            self.exclude(signature=signature).delete()
+
+            new_entries = fingerprint_cache.new_entries
+            fingerprints = list(new_entries)
+            existing = set()
+
+            for i in range(0, len(fingerprints), SQLITE_MAX_VARIABLES):
+                existing.update(self.filter(fingerprint__in=fingerprints[i:i + SQLITE_MAX_VARIABLES])
+                                    .values_list('fingerprint', flat=True))
+
+            self.bulk_create([
+                SubjectFingerprint(fingerprint=fingerprint, signature=signature,
+                                   app_ids=','.join(str(app_id) for app_id in sorted(app_ids)))
+                for fingerprint, app_ids in new_entries.items() if fingerprint not in existing
+            ])
+            fingerprint_cache.new_entries = {}
+
+    def invalidate(self):
+        self.all().delete()
+
+
+class SubjectFingerprint(models.Model):
+
+    fingerprint = models.CharField(max_length=255, unique=True)
+    signature = models.CharField(max_length=40, default='')
+    app_ids = models.TextField(default='', blank=True)
+
+    objects = SubjectFingerprintManager()
+
+    def __str__(self):
+        return self.fingerprint
+
+
+class ProcessingCursorManager(models.Manager):
+
+    def watermarks(self):
+        watermarks = dict((mailbox_id, 0) for mailbox_id in Mailbox.objects.values_list('id', flat=True))
+        watermarks.update(self.values_list('mailbox_id', 'last_message_id'))
+        return watermarks
+
+    def unconsidered_messages(self):
+        # A single id range keeps the date index usable; mailboxes that are
+        # further ahead exclude their already considered ids separately.
+        watermarks = self.watermarks()
+        lowest_watermark = min(watermarks.values()) if watermarks else 0
+        messages = Message.objects.filter(id__gt=lowest_watermark)
+
+        for mailbox_id, last_message_id in watermarks.items():
+            if last_message_id > lowest_watermark:
+                messages = messages.exclude(mailbox_id=mailbox_id, id__lte=last_message_id)
+
+        return messages
+
+    def advance(self, today):
+        # Everything up to the watermark has been considered, so the watermark
+        # stops right before the oldest message a scheduled run would still
+        # select. Messages dated outside the days those runs cover, or not
+        # dated at all, would hold it back forever; reprocessing such days
+        # goes around the cursor instead.
+        first_date = today - datetime.timedelta(days=CURSOR_LOOK_BACK_DAYS)
+        last_date = today + datetime.timedelta(days=1)
+
+        # Ids are shared by all mailboxes, so a mailbox with nothing pending
+        # moves up to the newest id overall. An empty or inactive mailbox
+        # would otherwise hold the lowest watermark at 0.
+        newest_message_id = Message.objects.aggregate(Max('id'))['id__max']
+
+        for mailbox_id, last_message_id in self.watermarks().items():
+            pending = Message.objects.filter(mailbox_id=mailbox_id, id__gt=last_message_id,
+                                             sent_date_local__range=(first_date, last_date))
+            first_pending_id = pending.extra(where=UNPROCESSED_MESSAGE_CONDITION).aggregate(Min('id'))['id__min']
+
+            if first_pending_id is None:
+                new_last_message_id = newest_message_id
+            else:
+                new_last_message_id = first_pending_id - 1
+
+            if new_last_message_id is not None and new_last_message_id > last_message_id:
+                self.update_or_create(mailbox_id=mailbox_id, defaults={'last_message_id': new_last_message_id})
+
+    def rewind(self, messages):
+        first_ids = messages.order_by().values('mailbox_id').annotate(first_id=Min('id'))
+
+        for mailbox_id, first_id in first_ids.values_list('mailbox_id', 'first_id'):
+            self.filter(mailbox_id=mailbox_id, last_message_id__gte=first_id).update(last_message_id=first_id - 1)
+
+
+class ProcessingCursor(models.Model):
+
+    mailbox = models.OneToOneField(Mailbox)
+    last_message_id = models.PositiveIntegerField(default=0)
+
+    objects = ProcessingCursorManager()
+
+    def __str__(self):
+        return '%s: %d' % (self.mailbox, self.last_message_id)
+
+
+class RematchRequestManager(models.Manager):
+
+    def enqueue(self, app_id):
+        return self.create(app_id=app_id)
+
+    def pending(self):
+        return list(self.order_by('id').values_list('id', 'app_id'))
+
+    def complete(self, request_ids):
+        for i in range(0, len(request_ids), SQLITE_MAX_VARIABLES):
+            self.filter(id__in=request_ids[i:i + SQLITE_MAX_VARIABLES]).delete()
+
+
+class RematchRequest(models.Model):
+
+    app = models.ForeignKey(App)
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RematchRequestManager()
+
+    def __str__(self):
+        return str(self.app)
+
+
+def make_lease_holder():
+    return '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def mailbox_lease_key(mailbox_id):
+    return 'mailbox:%d' % mailbox_id
+
+
+def day_lease_key(date_):
+    return 'day:%s' % date_.strftime("%Y-%m-%d")
+
+
+class LeaseManager(models.Manager):
+
+    def acquire(self, key, holder, seconds):
+        # Taking over is a single conditional UPDATE, so only one of several
+        # workers racing for an expired lease can win it.
+        now = timezone.now()
+        expires_at = now + datetime.timedelta(seconds=seconds)
+
+        taken = self.filter(Q(holder=holder) | Q(expires_at__lte=now), key=key).update(
+            holder=holder, expires_at=expires_at, heartbeat_at=now)
+        if taken:
+            return True
+
+        try:
+            with transaction.atomic():
+                self.create(key=key, holder=holder, expires_at=expires_at, heartbeat_at=now)
+        except IntegrityError:
+            return False
+
+        return True
+
+    def heartbeat(self, holder, seconds):
+        now = timezone.now()
+        return self.filter(holder=holder, expires_at__gt=now).update(
+            expires_at=now + datetime.timedelta(seconds=seconds), heartbeat_at=now)
+
+    def release(self, holder, key=None):
+        leases = self.filter(holder=holder)
+
+        if key is not None:
+            leases = leases.filter(key=key)
+
+        leases.delete()
+
+
+class Lease(models.Model):
+
+    key = models.CharField(max_length=64, unique=True)
+    holder = models.CharField(max_length=128)
+    expires_at = models.DateTimeField()
+    heartbeat_at = models.DateTimeField()
+
+    objects = LeaseManager()
+
+    def __str__(self):
+        return '%s: %s' % (self.key, self.holder)
+
 
 class Day(models.Model):
 
@@ -69,10 +425,187 @@ class Day(models.Model):
 class ExecutionManager(models.Manager):
 
     def generate_and_return_active_apps_execution_objects(self, date_):
-        day = self._get_or_create_day_object(date_)
-        active_apps = App.objects.filter(is_active=True)
-        executions = self._get_or_create_execution_objects(day, active_apps)
-        return executions
+        self.generate_executions_for_dates([date_])
+        return list(self.filter(day__date=date_, app__is_active=True).select_related('app', 'day').order_by('app_id'))
+
+    def generate_executions_for_dates(self, dates):
+        dates = sorted(set(dates))
+        return self._generate_executions(list(App.objects.filter(is_active=True)), dates)['created']
+
+    def active_apps_executions_between(self, start_date, end_date):
+        # Read-only: active apps without a stored row for a date get an unsaved
+        # Execution computed from their schedule, so viewing never writes.
+        active_apps = list(App.objects.filter(is_active=True))
+        due_dates = due_dates_by_app(ScheduleRule.objects.schedules_by_app(active_apps), start_date, end_date)
+        days = dict((day.date, day) for day in Day.objects.filter(date__range=(start_date, end_date)))
+        executions_by_key = {}
+
+        for execution in self.filter(day__date__range=(start_date, end_date),
+                                     app__is_active=True).select_related('app', 'day'):
+            executions_by_key[(execution.app_id, execution.day.date)] = execution
+
+        for app in active_apps:
+            for date_ in iter_dates(start_date, end_date, 1):
+                if (app.id, date_) not in executions_by_key:
+                    executions_by_key[(app.id, date_)] = Execution(day=days.get(date_) or Day(date=date_), app=app,
+                                                                   is_due_today=date_ in due_dates[app.id])
+
+        return active_apps, executions_by_key
+
+    def materialize(self, today, days_ahead):
+        # Apps whose schedule or activation changed since the last run are
+        # refreshed over the whole horizon, the others only get the days the
+        # horizon moved forward by.
+        end_date = today + datetime.timedelta(days=days_ahead)
+        report = {'apps': 0, 'created': 0, 'updated': 0, 'removed': 0}
+
+        with transaction.atomic():
+            active_apps = list(App.objects.filter(is_active=True))
+            signatures = ScheduleRule.objects.signatures_by_app(active_apps)
+            materialized = dict(MaterializedSchedule.objects.values_list('app_id', 'signature'))
+            materialized_until = dict(MaterializedSchedule.objects.values_list('app_id', 'materialized_until'))
+            apps_by_start_date = {}
+
+            for app in active_apps:
+                if materialized.get(app.id) != signatures[app.id]:
+                    apps_by_start_date.setdefault((today, True), []).append(app)
+                elif materialized_until[app.id] < end_date:
+                    start_date = max(today, materialized_until[app.id] + datetime.timedelta(days=1))
+                    apps_by_start_date.setdefault((start_date, False), []).append(app)
+
+            for (start_date, refresh), apps in apps_by_start_date.items():
+                counts = self._generate_executions(apps, list(iter_dates(start_date, end_date, 1)), refresh)
+                report['apps'] += len(apps)
+                report['created'] += counts['created']
+                report['updated'] += counts['updated']
+
+            removed_app_ids = [app_id for app_id in materialized if app_id not in signatures]
+            report['removed'] = self._remove_future_executions(removed_app_ids, today)
+            self._save_materialized_schedules([app for apps in apps_by_start_date.values() for app in apps],
+                                              removed_app_ids, end_date)
+
+        return report
+
+    def refresh_apps(self, app_ids, today):
+        # Only the given apps are touched, from today to the end of the
+        # materialized horizon, so an admin change costs the same whatever
+        # the total number of apps.
+        end_date = MaterializedSchedule.objects.aggregate(Max('materialized_until'))['materialized_until__max']
+        end_date = max(today, end_date or today)
+        report = {'apps': 0, 'created': 0, 'updated': 0, 'removed': 0}
+
+        with transaction.atomic():
+            apps = []
+            for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES):
+                apps.extend(App.objects.filter(id__in=app_ids[i:i + SQLITE_MAX_VARIABLES]))
+
+            active_apps = [app for app in apps if app.is_active]
+            inactive_app_ids = [app.id for app in apps if not app.is_active]
+
+            if active_apps:
+                counts = self._generate_executions(active_apps, list(iter_dates(today, end_date, 1)), refresh=True)
+                report['created'] = counts['created']
+                report['updated'] = counts['updated']
+
+            report['apps'] = len(apps)
+            report['removed'] = self._remove_future_executions(inactive_app_ids, today)
+            self._save_materialized_schedules(active_apps, inactive_app_ids, end_date)
+
+        return report
+
+    def _save_materialized_schedules(self, apps, removed_app_ids, end_date):
+        signatures = ScheduleRule.objects.signatures_by_app(apps)
+        app_ids = [app.id for app in apps] + list(removed_app_ids)
+        materialized_until = {}
+
+        for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES):
+            schedules = MaterializedSchedule.objects.filter(app_id__in=app_ids[i:i + SQLITE_MAX_VARIABLES])
+            materialized_until.update(schedules.values_list('app_id', 'materialized_until'))
+            schedules.delete()
+
+        MaterializedSchedule.objects.bulk_create([
+            MaterializedSchedule(app=app, signature=signatures[app.id],
+                                 materialized_until=max(end_date, materialized_until.get(app.id, end_date)))
+            for app in apps])
+
+    def _generate_executions(self, apps, dates, refresh=False):
+        # Another request may insert some of the same rows in between; the
+        # unique (day, app) constraint rejects the whole batch and the
+        # missing rows are worked out again. Existing rows keep the due date
+        # they were created with unless asked to refresh it.
+        for attempt in range(BULK_INSERT_ATTEMPTS):
+            executions, changed_ids = self._plan_executions(apps, dates, refresh)
+
+            try:
+                with transaction.atomic():
+                    self.bulk_create(executions)
+                break
+            except IntegrityError:
+                if attempt == BULK_INSERT_ATTEMPTS - 1:
+                    raise
+
+        updated = 0
+        for is_due_today, execution_ids in changed_ids.items():
+            for i in range(0, len(execution_ids), SQLITE_MAX_VARIABLES):
+                updated += self.filter(id__in=execution_ids[i:i + SQLITE_MAX_VARIABLES]).update(
+                    is_due_today=is_due_today)
+
+        return {'created': len(executions), 'updated': updated}
+
+    def _plan_executions(self, apps, dates, refresh):
+        days = self._get_or_create_day_objects(dates)
+        app_ids = [app.id for app in apps]
+        existing = {}
+
+        for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES):
+            executions = self.filter(day__date__range=(dates[0], dates[-1]),
+                                     app_id__in=app_ids[i:i + SQLITE_MAX_VARIABLES])
+
+            for execution_id, day_id, app_id, is_due_today, is_executed in executions.values_list(
+                    'id', 'day_id', 'app_id', 'is_due_today', 'is_executed'):
+                existing[(day_id, app_id)] = (execution_id, is_due_today, is_executed)
+
+        due_dates = due_dates_by_app(ScheduleRule.objects.schedules_by_app(apps), dates[0], dates[-1])
+        executions = []
+        changed_ids = {True: [], False: []}
+
+        for day in days:
+            for app in apps:
+                is_due_today = day.date in due_dates[app.id]
+
+                if (day.id, app.id) not in existing:
+                    executions.append(Execution(day=day, app=app, is_due_today=is_due_today))
+                    continue
+
+                execution_id, was_due_today, is_executed = existing[(day.id, app.id)]
+                if refresh and not is_executed and was_due_today != is_due_today:
+                    changed_ids[is_due_today].append(execution_id)
+
+        return executions, changed_ids
+
+    def _remove_future_executions(self, app_ids, today):
+        removed = 0
+
+        for i in range(0, len(app_ids), SQLITE_MAX_VARIABLES):
+            executions = self.filter(app_id__in=app_ids[i:i + SQLITE_MAX_VARIABLES], day__date__gt=today,
+                                     is_executed=False)
+            removed += executions.count()
+            executions.delete()
+
+        return removed
+
+    def _get_or_create_day_objects(self, dates):
+        for attempt in range(BULK_INSERT_ATTEMPTS):
+            days = Day.objects.filter(date__range=(dates[0], dates[-1]))
+            existing = set(day.date for day in days)
+
+            try:
+                with transaction.atomic():
+                    Day.objects.bulk_create([Day(date=date_) for date_ in dates if date_ not in existing])
+                return [day for day in days.all() if day.date in dates]
+            except IntegrityError:
+                if attempt == BULK_INSERT_ATTEMPTS - 1:
+                    raise
 
     def _get_or_create_day_object(self, date_):
         day, is_new = Day.objects.get_or_create(date=date_)
@@ -94,42 +627,12 @@ class ExecutionManager(models.Manager):
             execution, is_new = Execution.objects.get_or_create(
                                     day=day_,
                                     app=app_,
-                                    is_due_today=self._app_due_today(app_, day_.date))
+                                    defaults={'is_due_today': ScheduleRule.objects.schedules_by_app([app_])[app_.id].is_due(day_.date)})
             return execution
 
         else:
             return None
 
-    def _app_due_today(self, app, date_today):
-        if app.frequency == 'daily':
-            return True
-
-        elif 'weekly' in app.frequency:
-            return bool(date_today.strftime("%A") == self._get_day_of_week_from_string(app.frequency))
-
-        elif 'monthly' in app.frequency:
-            return bool(date_today.strftime("%d") == self._get_day_of_month_from_string(app.frequency))
-
-        else:
-            return False
-
-    def _get_day_of_week_from_string(self, weekly_date_string):
-        day_list = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-
-        for day in day_list:
-            if day.lower() in weekly_date_string.lower():
-                return day
-
-    def _get_day_of_month_from_string(self, monthly_date_string):
-        day_list = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10',
-                    '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
-                    '21', '22', '23', '24', '25', '26', '27', '18', '20', '30', '31',
-                    ]
-
-        for day in day_list:
-            if day in monthly_date_string:
-                return day
-
 
 class Execution(models.Model):
     day = models.ForeignKey(Day)
@@ -140,6 +643,10 @@ class Execution(models.Model):
 
     objects = ExecutionManager()
 
+    class Meta:
+        unique_together = [['day', 'app']]
+        index_together = [['app', 'day']]
+
     def __str__(self):
 
         if self.is_executed is True:
@@ -0,0 +1,194 @@
+from collections import namedtuple
+from functools import lru_cache
+import calendar
+import datetime
+import re
+
+WEEKDAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+WEEKDAY_NAME = re.compile(r'(mon|tue|wed|thu|fri|sat|sun)[a-z]*', re.IGNORECASE)
+DIGITS = re.compile(r'\d+')
+LIST_SEPARATORS = re.compile(r'[\s,;]+')
+
+ScheduleRuleRow = namedtuple('ScheduleRuleRow', ['kind', 'value', 'start_date'])
+
+EXCLUDE_DATES = 'exclude_dates'
+
+
+class DailyRule(object):
+
+    def due_dates(self, start_date, end_date, non_business_dates):
+        return set(iter_dates(start_date, end_date, 1))
+
+
+class WeekdayRule(object):
+
+    def __init__(self, weekdays):
+        self.weekdays = weekdays
+
+    def due_dates(self, start_date, end_date, non_business_dates):
+        due = set()
+
+        for weekday in self.weekdays:
+            first_date = start_date + datetime.timedelta(days=(weekday - start_date.weekday()) % 7)
+            due.update(iter_dates(first_date, end_date, 7))
+
+        return due
+
+
+class DayOfMonthRule(object):
+
+    def __init__(self, days):
+        self.days = days
+
+    def due_dates(self, start_date, end_date, non_business_dates):
+        due = set()
+
+        for year, month in iter_months(start_date, end_date):
+            month_length = calendar.monthrange(year, month)[1]
+            due.update(datetime.date(year, month, day) for day in self.days if day <= month_length)
+
+        return set(date_ for date_ in due if start_date <= date_ <= end_date)
+
+
+class LastBusinessDayRule(object):
+
+    def due_dates(self, start_date, end_date, non_business_dates):
+        # Excluded dates count as holidays, so the rule moves to the business
+        # day before them instead of being dropped for the month.
+        due = set()
+
+        for year, month in iter_months(start_date, end_date):
+            date_ = datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+            while date_.weekday() >= 5 or date_ in non_business_dates:
+                date_ -= datetime.timedelta(days=1)
+
+            if start_date <= date_ <= end_date:
+                due.add(date_)
+
+        return due
+
+
+class EveryNDaysRule(object):
+
+    def __init__(self, interval, start_date):
+        self.interval = interval
+        self.start_date = start_date
+
+    def due_dates(self, start_date, end_date, non_business_dates):
+        skipped_intervals = max(0, -((self.start_date - start_date).days // self.interval))
+        first_date = self.start_date + datetime.timedelta(days=skipped_intervals * self.interval)
+        return set(iter_dates(first_date, end_date, self.interval))
+
+
+class Schedule(object):
+
+    def __init__(self, rules, excluded_dates=()):
+        self.rules = rules
+        self.excluded_dates = frozenset(excluded_dates)
+
+    def due_dates(self, start_date, end_date):
+        due = set()
+
+        for rule in self.rules:
+            due.update(rule.due_dates(start_date, end_date, self.excluded_dates))
+
+        return due - self.excluded_dates
+
+    def is_due(self, date_):
+        return date_ in self.due_dates(date_, date_)
+
+
+def iter_dates(first_date, end_date, step_days):
+    step = datetime.timedelta(days=step_days)
+
+    while first_date <= end_date:
+        yield first_date
+        first_date += step
+
+
+def iter_months(start_date, end_date):
+    year, month = start_date.year, start_date.month
+
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def parse_weekdays(text):
+    return sorted(set(WEEKDAY_NAMES.index(name.lower()) for name in WEEKDAY_NAME.findall(text)))
+
+
+def parse_dates(text):
+    return [datetime.datetime.strptime(value, "%Y-%m-%d").date() for value in LIST_SEPARATORS.split(text) if value]
+
+
+def compile_rule(kind, value, start_date=None):
+    if kind == 'weekdays':
+        weekdays = parse_weekdays(value)
+        if not weekdays:
+            raise ValueError('Expected weekday names, e.g. "mon, thu"')
+        return WeekdayRule(weekdays)
+
+    elif kind == 'days_of_month':
+        days = sorted(set(int(day) for day in DIGITS.findall(value)))
+        if not days or days[0] < 1 or days[-1] > 31:
+            raise ValueError('Expected days of month between 1 and 31, e.g. "1, 15"')
+        return DayOfMonthRule(days)
+
+    elif kind == 'last_business_day':
+        return LastBusinessDayRule()
+
+    elif kind == 'every_n_days':
+        if not value.strip().isdigit() or int(value) < 1 or start_date is None:
+            raise ValueError('Expected a number of days and a start date')
+        return EveryNDaysRule(int(value), start_date)
+
+    raise ValueError('Unknown schedule rule "%s"' % kind)
+
+
+def compile_frequency(frequency):
+    frequency = frequency.lower()
+
+    if frequency == 'daily':
+        return DailyRule()
+
+    elif 'weekly' in frequency and parse_weekdays(frequency):
+        return WeekdayRule(parse_weekdays(frequency))
+
+    elif 'monthly' in frequency and DIGITS.search(frequency):
+        return DayOfMonthRule([int(day) for day in DIGITS.findall(frequency)])
+
+    return None
+
+
+@lru_cache(maxsize=1024)
+def compile_schedule(frequency, rule_rows=()):
+    # Rules replace the frequency string of an App once it has any inclusion
+    # rule; exclusion dates apply either way. Identical schedules compile to
+    # the same object, so due dates can be computed once per schedule.
+    rules = []
+    excluded_dates = []
+
+    for row in rule_rows:
+        row = ScheduleRuleRow(*row)
+
+        if row.kind == EXCLUDE_DATES:
+            excluded_dates.extend(parse_dates(row.value))
+        else:
+            rules.append(compile_rule(row.kind, row.value, row.start_date))
+
+    if not rules:
+        rule = compile_frequency(frequency)
+        rules = [rule] if rule is not None else []
+
+    return Schedule(rules, excluded_dates)
+
+
+def due_dates_by_app(schedules_by_app, start_date, end_date):
+    due_dates_by_schedule = {}
+
+    for schedule in set(schedules_by_app.values()):
+        due_dates_by_schedule[schedule] = schedule.due_dates(start_date, end_date)
+
+    return dict((app_id, due_dates_by_schedule[schedule]) for app_id, schedule in schedules_by_app.items())
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django_mailbox.signals import message_received
+from batch_apps.integration import invalidate_pattern_snapshot, process_incoming_email
+from batch_apps.models import App, Pattern, RematchRequest, SubjectFingerprint
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Pattern)
+@receiver(post_delete, sender=Pattern)
+def invalidate_fingerprints_on_pattern_change(sender, **kwargs):
+    SubjectFingerprint.objects.invalidate()
+    invalidate_pattern_snapshot()
+
+
+@receiver(post_save, sender=Pattern)
+def queue_rematch_on_pattern_save(sender, instance, **kwargs):
+    RematchRequest.objects.enqueue(instance.app_id)
+
+
+@receiver(post_save, sender=App)
+@receiver(post_delete, sender=App)
+def invalidate_pattern_snapshot_on_app_change(sender, **kwargs):
+    invalidate_pattern_snapshot()
+
+
+@receiver(pre_save, sender=App)
+def invalidate_fingerprints_on_app_activation_change(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+
+    was_active = App.objects.filter(pk=instance.pk).values_list('is_active', flat=True).first()
+
+    if was_active is not None and was_active != instance.is_active:
+        SubjectFingerprint.objects.invalidate()
+
+
+@receiver(message_received)
+def match_incoming_message(sender, message, **kwargs):
+    if not getattr(settings, 'BATCHER_REALTIME_MATCHING', False):
+        return
+
+    # django_mailbox silently swallows anything a receiver raises; the batch
+    # pass still picks the email up, but the failure should leave a trace.
+    try:
+        process_incoming_email(message)
+    except Exception:
+        logger.exception('Real-time matching failed for message %s', message.pk)
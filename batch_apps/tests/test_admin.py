@@ -1,7 +1,9 @@
 from django.test import TestCase
 from django.contrib.admin.sites import AdminSite
-from batch_apps.models import App, Day, Execution
-from batch_apps.admin import AppAdmin, DayAdmin
+from batch_apps.models import App, Day, Execution, ScheduleRule
+from batch_apps.generator import get_current_date_in_gmt8
+from batch_apps.admin import AppAdmin, DayAdmin, PatternInline
+from unittest import mock
 import datetime
 
 
@@ -28,6 +30,37 @@ class AppAdminTest(TestCase):
         self.app_admin.deactivate_apps(request, queryset)
         self.assertFalse(App.objects.get(pk=1).is_active)
 
+    def test_activate_apps_should_create_executions_of_activated_apps_only(self):
+        app1 = App.objects.create(name='Inactive App 001', is_active=False, frequency='daily')
+        App.objects.create(name='Active App 001', is_active=True, frequency='daily')
+
+        self.app_admin.activate_apps(request, App.objects.filter(pk=app1.pk))
+
+        self.assertEqual(list(Execution.objects.values_list('app_id', 'day__date', 'is_due_today')),
+                         [(app1.id, get_current_date_in_gmt8(), True)])
+
+    def test_deactivate_apps_should_remove_future_executions_of_deactivated_apps(self):
+        app1 = App.objects.create(name='Active App 001', is_active=True, frequency='daily')
+        Execution.objects.materialize(get_current_date_in_gmt8(), 3)
+
+        self.app_admin.deactivate_apps(request, App.objects.filter(pk=app1.pk))
+
+        self.assertEqual(list(Execution.objects.values_list('day__date', flat=True)), [get_current_date_in_gmt8()])
+
+    def test_save_related_should_refresh_executions_with_the_saved_schedule_rules(self):
+        app1 = App.objects.create(name='Active App 001', is_active=True, frequency='daily')
+        Execution.objects.materialize(get_current_date_in_gmt8(), 6)
+        ScheduleRule.objects.create(app=app1, kind='weekdays', value='mon')
+
+        self.app_admin.save_related(request, mock.Mock(instance=app1), [], True)
+
+        self.assertEqual(Execution.objects.filter(app=app1).count(), 7)
+        self.assertEqual(Execution.objects.filter(app=app1, is_due_today=True).count(), 1)
+
+    def test_pattern_inline_should_show_pattern_kind_and_match_statistics(self):
+        pattern_inline = PatternInline(App, AdminSite())
+        self.assertEqual(pattern_inline.readonly_fields, ('kind', 'match_count', 'hit_count', 'match_time'))
+
 
 class DayAdminTest(TestCase):
 
@@ -1,6 +1,16 @@
 from django.test import TestCase
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.utils.six import StringIO
+from unittest import mock
+from django_mailbox.models import Message
+from batch_apps.integration import invalidate_pattern_snapshot
+from batch_apps.matcher import CompiledPatternSet
+from batch_apps.models import App, Execution, Pattern, RematchRequest
+
+import datetime
+import os
+import signal
 
 
 class GetEmailsAndProcessCommandTest(TestCase):
@@ -11,9 +21,105 @@ class GetEmailsAndProcessCommandTest(TestCase):
         self.assertIn('get_emails_and_process command executed', output.getvalue())
 
 
+class BatcherDaemonCommandTest(TestCase):
+
+    def test_batcher_daemon_should_process_today_on_every_cycle(self):
+        output = StringIO()
+        call_command('batcher_daemon', stdout=output, cycles=2, interval=0)
+
+        self.assertEqual(output.getvalue().count('emails processed'), 2)
+        self.assertIn('batcher_daemon stopped after 2 cycles', output.getvalue())
+
+    def test_batcher_daemon_should_compile_patterns_once_while_they_do_not_change(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        Pattern.objects.create(app=app, name_pattern='Export Done', is_active=True)
+        RematchRequest.objects.all().delete()
+        invalidate_pattern_snapshot()
+
+        with mock.patch('batch_apps.integration.CompiledPatternSet', wraps=CompiledPatternSet) as pattern_set_class:
+            call_command('batcher_daemon', stdout=StringIO(), cycles=2, interval=0)
+
+        self.assertEqual(pattern_set_class.call_count, 1)
+
+    @mock.patch('batch_apps.management.commands.batcher_daemon.fetch_new_mail')
+    def test_batcher_daemon_should_stop_after_the_current_cycle_on_sigterm(self, mock_function):
+        mock_function.side_effect = lambda: os.kill(os.getpid(), signal.SIGTERM)
+
+        output = StringIO()
+        call_command('batcher_daemon', stdout=output, interval=60)
+
+        self.assertIn('batcher_daemon stopped after 1 cycles', output.getvalue())
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+    @mock.patch('batch_apps.management.commands.batcher_daemon.execute_end_to_end_tasks')
+    @mock.patch('batch_apps.management.commands.batcher_daemon.get_current_date_in_gmt8')
+    def test_batcher_daemon_should_work_out_today_on_every_cycle(self, mock_today, mock_execute):
+        mock_today.side_effect = [datetime.date(2014, 10, 20), datetime.date(2014, 10, 21)]
+        mock_execute.return_value = {'emails': 0, 'rows_written': 0, 'seconds': 0.0, 'fingerprint_hit_rate': 0.0}
+
+        call_command('batcher_daemon', stdout=StringIO(), cycles=2, interval=0)
+
+        self.assertEqual([call[0][0] for call in mock_execute.call_args_list],
+                         [datetime.date(2014, 10, 20), datetime.date(2014, 10, 20), datetime.date(2014, 10, 21)])
+
+
+class MaterializeExecutionsCommandTest(TestCase):
+
+    def test_materialize_executions_command_should_create_executions_ahead_of_today(self):
+        App.objects.create(name='My App 001', is_active=True, frequency='daily')
+
+        output = StringIO()
+        call_command('materialize_executions', stdout=output, days_ahead=3)
+
+        self.assertIn('1 apps materialized, 4 executions created', output.getvalue())
+        self.assertIn('materialize_executions command executed', output.getvalue())
+
+    def test_materialize_executions_command_should_reject_negative_days_ahead(self):
+        with self.assertRaises(CommandError):
+            call_command('materialize_executions', stdout=StringIO(), days_ahead=-1)
+
+
 class ProcessPreviousDayEmailTest(TestCase):
 
     def test_process_previous_day_email_command_should_be_launchable_using_call_command(self):
         output = StringIO()
         call_command('process_previous_day', stdout=output)
         self.assertIn('process_previous_day command executed', output.getvalue())
+
+
+class ProcessRangeCommandTest(TestCase):
+
+    fixtures = ['test_apps.json', 'test_messages.json']
+
+    def test_process_range_command_should_process_every_day_in_one_pass(self):
+        output = StringIO()
+        call_command('process_range', stdout=output, **{'from': '2014-10-19', 'to': '2014-10-21'})
+
+        self.assertIn('2014-10-20: 6 emails, 1 matched', output.getvalue())
+        self.assertIn('process_range command executed', output.getvalue())
+        self.assertEqual(Execution.objects.filter(day__date__range=(datetime.date(2014, 10, 19),
+                                                                    datetime.date(2014, 10, 21))).values('day').distinct().count(), 3)
+        execution = Execution.objects.get(app__name="SGDailyAppTask SendExpiringNotice", day__date=datetime.date(2014, 10, 20))
+        self.assertTrue(execution.is_executed)
+
+    def test_process_range_command_dry_run_should_not_save_anything(self):
+        output = StringIO()
+        call_command('process_range', dry_run=True, stdout=output, **{'from': '2014-10-19', 'to': '2014-10-21'})
+
+        self.assertIn('2014-10-20: 6 emails, 1 matched', output.getvalue())
+        self.assertIn('dry run, no changes saved', output.getvalue())
+        self.assertEqual(Execution.objects.count(), 0)
+        self.assertFalse(Message.objects.filter(processed_batch_apps=True).exists())
+
+    def test_process_range_command_should_reject_reversed_range(self):
+        with self.assertRaises(CommandError):
+            call_command('process_range', **{'from': '2014-10-21', 'to': '2014-10-19'})
+
+
+class BenchmarkMatcherCommandTest(TestCase):
+
+    def test_benchmark_matcher_command_should_report_candidate_reduction(self):
+        output = StringIO()
+        call_command('benchmark_matcher', apps=100, emails=50, stdout=output)
+        self.assertIn('candidate apps per email: 100 without index', output.getvalue())
+        self.assertIn('results identical: True', output.getvalue())
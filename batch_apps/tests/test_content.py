@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django_mailbox.models import Message
+
+from batch_apps.content import extract_plain_text, iter_body_bytes
+
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+def build_stored_message(*parts):
+    multipart = MIMEMultipart()
+    for part in parts:
+        multipart.attach(part)
+
+    message = Message()
+    message.set_body(multipart.as_string())
+    return message
+
+
+class PlainTextExtractionTest(TestCase):
+
+    def test_extract_plain_text_should_return_only_text_plain_parts(self):
+        message = build_stored_message(MIMEText("Rows processed: 42\nStatus: SUCCESS", 'plain'),
+                                       MIMEText("<b>Status: FAILED</b>", 'html'))
+
+        content = extract_plain_text(message.body, message.encoded, 64 * 1024)
+        self.assertIn("Status: SUCCESS", content)
+        self.assertNotIn("FAILED", content)
+
+    def test_extract_plain_text_should_skip_text_plain_attachments(self):
+        attachment = MIMEText("Status: FAILED", 'plain')
+        attachment.add_header('Content-Disposition', 'attachment', filename='log.txt')
+        message = build_stored_message(MIMEText("Status: SUCCESS", 'plain'), attachment)
+
+        content = extract_plain_text(message.body, message.encoded, 64 * 1024)
+        self.assertIn("Status: SUCCESS", content)
+        self.assertNotIn("FAILED", content)
+
+    def test_extract_plain_text_should_skip_dehydrated_attachment_placeholders(self):
+        placeholder = MIMEApplication(b'')
+        del placeholder['Content-Type']
+        placeholder['X-Django-Mailbox-Interpolate-Attachment'] = '1'
+        message = build_stored_message(MIMEText("Status: SUCCESS", 'plain'), placeholder)
+
+        content = extract_plain_text(message.body, message.encoded, 64 * 1024)
+        self.assertEqual(content.strip(), "Status: SUCCESS")
+
+    def test_extract_plain_text_should_stop_at_the_byte_limit(self):
+        message = Message()
+        message.set_body("Subject: Report\n\n" + "x" * 20000 + "Status: SUCCESS")
+
+        self.assertNotIn("SUCCESS", extract_plain_text(message.body, message.encoded, 10000))
+        self.assertIn("SUCCESS", extract_plain_text(message.body, message.encoded, 64 * 1024))
+
+    def test_iter_body_bytes_should_decode_at_most_the_byte_limit(self):
+        message = Message()
+        message.set_body("y" * 50000)
+
+        decoded = b''.join(iter_body_bytes(message.body, message.encoded, 10000))
+        self.assertEqual(decoded, b"y" * 10000)
+
+    def test_iter_body_bytes_should_read_unencoded_bodies(self):
+        decoded = b''.join(iter_body_bytes("Subject: Report\n\nStatus: SUCCESS", False, 1024))
+        self.assertEqual(decoded, b"Subject: Report\n\nStatus: SUCCESS")
@@ -5,8 +5,11 @@ from batch_apps.generator import (
     date_to_str,
     generate_one_week_date,
     get_current_date_in_gmt8,
+    get_date_in_gmt8,
 )
 
+from unittest import mock
+
 import pytz
 import datetime
 
@@ -18,6 +21,10 @@ class GenerateDateTest(TestCase):
         converted_datetime = datetime_utc.astimezone((pytz.timezone('Asia/Kuala_Lumpur')))
         self.assertEqual(get_current_date_in_gmt8(), converted_datetime.date())
 
+    def test_get_date_in_gmt8_should_read_naive_datetimes_in_the_default_time_zone(self):
+        with mock.patch('batch_apps.generator.timezone.get_default_timezone', return_value=pytz.utc):
+            self.assertEqual(get_date_in_gmt8(datetime.datetime(2014, 10, 20, 20, 0)), datetime.date(2014, 10, 21))
+
     def test_date_from_str_should_return_date_object_from_iso_format_string(self):
         expected_date_object = datetime.datetime.strptime('2014-11-25', "%Y-%m-%d").date()
         self.assertEqual(date_from_str('2014-11-25'), expected_date_object)
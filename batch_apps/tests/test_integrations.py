@@ -1,19 +1,60 @@
-from django.test import TestCase
-from django_mailbox.models import Message
-
-from batch_apps.models import App, Day, Execution
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_mailbox.admin import set_as_unprocessed
+from django_mailbox.models import Mailbox, Message
+from django_mailbox.signals import message_received
+
+from batch_apps.models import (
+    PROCESSED_UNMATCHED_MESSAGE_CONDITION,
+    App,
+    Day,
+    Execution,
+    Lease,
+    Pattern,
+    ProcessingCursor,
+    RematchRequest,
+    day_lease_key,
+    mailbox_lease_key,
+)
 from batch_apps.generator import get_current_date_in_gmt8
 
 from batch_apps.integration import (
+    EmailRow,
+    apply_match_matrix,
+    describe_report,
     execute_end_to_end_tasks,
+    execute_end_to_end_tasks_for_dates,
+    fetch_new_mail,
+    filter_content_matches,
     get_unexecuted_due_executions,
     get_unprocessed_unmatched_emails,
+    match_dates,
+    refresh_pattern_snapshot,
 )
 
-from batch_apps.matcher import match_subject
+from batch_apps.matcher import CompiledPatternSet, match_subject
+
+from email import message_from_string
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from unittest import mock, skipUnless
 
 import datetime
+import os
 import pytz
+import tracemalloc
+
+
+def create_app_with_pattern(name_pattern="Export Done", frequency='daily', **pattern_fields):
+    app = App.objects.create(name="My App 001", is_active=True, frequency=frequency)
+    Pattern.objects.create(app=app, name_pattern=name_pattern, is_active=True, **pattern_fields)
+    return app
+
+
+def create_email(mailbox, subject, sent_time, processed=False):
+    return Message.objects.create(mailbox=mailbox, subject=subject, sent_time=sent_time,
+                                  processed_batch_apps=processed)
 
 
 class EmailExecutionAppPatternMatcherTest(TestCase):
@@ -90,6 +131,21 @@ class EmailExecutionAppPatternMatcherTest(TestCase):
         self.assertTrue(execution_recheck.is_executed)
         self.assertEqual(execution_recheck.email, email)
 
+    def test_execute_end_to_end_module_should_reuse_fingerprints_from_previous_runs(self):
+        report = execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        self.assertEqual(report['fingerprint_hit_rate'], 0.0)
+        self.assertEqual(report['emails'], 6)
+
+        Message.objects.update(processed_batch_apps=False, matched_batch_apps=False)
+        ProcessingCursor.objects.rewind(Message.objects.all())
+        Execution.objects.update(is_executed=False, email=None)
+
+        report = execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        self.assertEqual(report['fingerprint_hit_rate'], 1.0)
+
+        execution = Execution.objects.get(app__name="SGDailyAppTask SendExpiringNotice", day__date=datetime.date(2014, 10, 20))
+        self.assertTrue(execution.is_executed)
+
     def test_execute_end_to_end_module_should_default_to_today_if_date_is_not_given(self):
         execute_end_to_end_tasks()
         day = Day.objects.get(pk=1)
@@ -164,6 +220,579 @@ class EmailFilteringTest(TestCase):
         self.assertNotIn(self.email4, results)
 
 
+class CapturedDateRoutingTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+        self.app = create_app_with_pattern(is_capturing_date=True, date_pattern='dd/mm/yyyy')
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 20), datetime.date(2014, 10, 22)])
+
+    def test_late_email_should_mark_the_execution_of_its_captured_date(self):
+        email = create_email(self.mailbox, "Export Done, run for 20/10/2014", datetime.datetime(2014, 10, 22, 2, 0, tzinfo=pytz.utc))
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 22))
+
+        self.assertEqual(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 20)).email, email)
+        self.assertFalse(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 22)).is_executed)
+
+    def test_captured_date_without_due_execution_should_not_credit_the_email_date(self):
+        create_email(self.mailbox, "Export Done, run for 21/10/2014", datetime.datetime(2014, 10, 22, 2, 0, tzinfo=pytz.utc))
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 22))
+
+        self.assertFalse(Execution.objects.filter(app=self.app, is_executed=True).exists())
+
+    def test_one_pass_should_fill_several_days_from_captured_dates(self):
+        first = create_email(self.mailbox, "Export Done, run for 20/10/2014", datetime.datetime(2014, 10, 22, 2, 0, tzinfo=pytz.utc))
+        second = create_email(self.mailbox, "Export Done, run for 22/10/2014", datetime.datetime(2014, 10, 22, 3, 0, tzinfo=pytz.utc))
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 22))
+
+        self.assertEqual(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 20)).email, first)
+        self.assertEqual(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 22)).email, second)
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_realtime_matching_should_route_by_captured_date(self):
+        message = self.mailbox.process_incoming_message(message_from_string(
+            "Subject: Export Done, run for 20/10/2014\n"
+            "Date: Wed, 22 Oct 2014 10:31:25 +0800\n"
+            "\n"
+            "body\n"))
+
+        self.assertEqual(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 20)).email, message)
+
+
+class PatternRematchTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+        self.app = App.objects.create(name="My App 001", is_active=True, frequency='daily')
+        self.other_app = App.objects.create(name="My App 002", is_active=True, frequency='daily')
+        self.pattern = Pattern.objects.create(app=self.app, name_pattern="Exprot Done", is_active=True)
+        Pattern.objects.create(app=self.other_app, name_pattern="Done", is_active=True)
+
+    def test_saving_pattern_should_queue_a_rematch_of_its_app(self):
+        RematchRequest.objects.all().delete()
+        self.pattern.save()
+        self.assertEqual([app_id for request_id, app_id in RematchRequest.objects.pending()], [self.app.id])
+
+    def test_fixed_pattern_should_rematch_processed_unmatched_emails_of_its_app_only(self):
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 18), datetime.date(2014, 10, 20)])
+        email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 18, 2, 0, tzinfo=pytz.utc),
+                             processed=True)
+        RematchRequest.objects.all().delete()
+
+        self.pattern.name_pattern = "Export Done"
+        self.pattern.save()
+        report = execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+
+        self.assertEqual(report['rematched_apps'], [self.app.id])
+        self.assertEqual(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 18)).email, email)
+        self.assertFalse(Execution.objects.get(app=self.other_app, day__date=datetime.date(2014, 10, 18)).is_executed)
+        self.assertTrue(Message.objects.get(pk=email.pk).matched_batch_apps)
+        self.assertEqual(RematchRequest.objects.count(), 0)
+
+    def test_rematch_should_ignore_emails_outside_the_look_back_window(self):
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 1), datetime.date(2014, 10, 20)])
+        create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 1, 2, 0, tzinfo=pytz.utc), processed=True)
+
+        self.pattern.name_pattern = "Export Done"
+        self.pattern.save()
+        execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+
+        self.assertFalse(Execution.objects.get(app=self.app, day__date=datetime.date(2014, 10, 1)).is_executed)
+
+
+class RealtimeMatchingTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+        self.app = create_app_with_pattern()
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 20)])
+
+    def receive_email(self, subject):
+        return self.mailbox.process_incoming_message(message_from_string(
+            "Subject: %s\n"
+            "From: Batch Host <batch01@hosts.example.com>\n"
+            "Date: Mon, 20 Oct 2014 10:31:25 +0800\n"
+            "\n"
+            "body\n" % subject))
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_incoming_email_should_execute_due_execution_when_enabled(self):
+        message = self.receive_email("Export Done")
+
+        execution = Execution.objects.get(app=self.app)
+        self.assertTrue(execution.is_executed)
+        self.assertEqual(execution.email, message)
+        self.assertTrue(Message.objects.get(pk=message.pk).matched_batch_apps)
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_unmatched_incoming_email_should_be_left_for_the_batch_pass(self):
+        message = self.receive_email("Something else")
+
+        self.assertFalse(Execution.objects.get(app=self.app).is_executed)
+        self.assertFalse(Message.objects.get(pk=message.pk).processed_batch_apps)
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_pattern_snapshot_should_pick_up_pattern_changes(self):
+        self.receive_email("Import Done")
+        Pattern.objects.create(app=self.app, name_pattern="Done", is_active=True)
+        Pattern.objects.filter(name_pattern="Export Done").delete()
+
+        self.receive_email("Import Done")
+        self.assertTrue(Execution.objects.get(app=self.app).is_executed)
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_refresh_pattern_snapshot_should_pick_up_changes_made_by_another_process(self):
+        self.receive_email("Import Done")
+        Pattern.objects.filter(app=self.app).update(name_pattern="Import Done", compiled_pattern="Import Done")
+
+        refresh_pattern_snapshot()
+        self.receive_email("Import Done")
+        self.assertTrue(Execution.objects.get(app=self.app).is_executed)
+
+    def test_refresh_pattern_snapshot_should_keep_the_compiled_set_when_nothing_changed(self):
+        snapshot = refresh_pattern_snapshot()
+        self.assertIs(refresh_pattern_snapshot().pattern_set, snapshot.pattern_set)
+
+    def test_batch_pass_should_match_with_the_resident_snapshot(self):
+        self.receive_email("Export Done")
+        snapshot = refresh_pattern_snapshot()
+
+        with mock.patch('batch_apps.integration.CompiledPatternSet') as pattern_set_class:
+            report = execute_end_to_end_tasks(datetime.date(2014, 10, 20), snapshot)
+
+        self.assertFalse(pattern_set_class.called)
+        self.assertEqual(report['emails'], 1)
+        self.assertTrue(Execution.objects.get(app=self.app).is_executed)
+
+    def test_batch_passes_sharing_a_snapshot_should_only_record_their_own_pattern_stats(self):
+        RematchRequest.objects.all().delete()
+        snapshot = refresh_pattern_snapshot()
+
+        for subject in ("Export Failed", "Export Done"):
+            self.receive_email(subject)
+            execute_end_to_end_tasks(datetime.date(2014, 10, 20), snapshot)
+
+        self.assertEqual(Pattern.objects.get(app=self.app).match_count, 2)
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    def test_incoming_email_should_record_its_pattern_stats(self):
+        self.receive_email("Export Done")
+
+        pattern = Pattern.objects.get(app=self.app)
+        self.assertEqual((pattern.match_count, pattern.hit_count), (1, 1))
+
+    @override_settings(BATCHER_REALTIME_MATCHING=True)
+    @mock.patch('batch_apps.signals.process_incoming_email', side_effect=RuntimeError('database is locked'))
+    def test_realtime_matching_failures_should_be_logged(self, mock_process):
+        with self.assertLogs('batch_apps.signals', 'ERROR') as logs:
+            message = self.receive_email("Export Done")
+
+        self.assertIn('Real-time matching failed for message %s' % message.pk, logs.output[0])
+        self.assertFalse(Message.objects.get(pk=message.pk).processed_batch_apps)
+
+    def test_incoming_email_should_not_be_matched_when_disabled(self):
+        self.receive_email("Export Done")
+        self.assertFalse(Execution.objects.get(app=self.app).is_executed)
+
+
+class FetchNewMailTest(TestCase):
+
+    def test_fetch_new_mail_should_renew_the_mailbox_lease_as_messages_arrive(self):
+        mailbox = Mailbox.objects.create(name="Batch Apps", active=True)
+        expiries = []
+
+        def get_new_mail(mailbox_):
+            lease = Lease.objects.get(key=mailbox_lease_key(mailbox_.id))
+            Lease.objects.filter(pk=lease.pk).update(expires_at=timezone.now() + datetime.timedelta(seconds=1))
+            message_received.send(sender=mailbox_, message=None)
+            expiries.append(Lease.objects.get(pk=lease.pk).expires_at)
+            return []
+
+        with mock.patch.object(Mailbox, 'get_new_mail', autospec=True, side_effect=get_new_mail):
+            fetch_new_mail()
+
+        self.assertGreater(expiries[0], timezone.now() + datetime.timedelta(seconds=60))
+        self.assertFalse(Lease.objects.exists())
+
+
+class DateRangeProcessingTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+        self.app = create_app_with_pattern(frequency='weekly monday')
+
+    def test_process_dates_should_match_emails_to_executions_of_their_local_date(self):
+        sunday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 2, 0, tzinfo=pytz.utc))
+        monday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 16, 30, tzinfo=pytz.utc))
+
+        report = execute_end_to_end_tasks_for_dates([datetime.date(2014, 10, 19), datetime.date(2014, 10, 20)])
+
+        self.assertEqual(report['emails'], 2)
+        execution = Execution.objects.get(app=self.app, is_due_today=True)
+        self.assertEqual(execution.day.date, datetime.date(2014, 10, 20))
+        self.assertEqual(execution.email, monday_email)
+        self.assertFalse(Message.objects.get(pk=sunday_email.pk).matched_batch_apps)
+        self.assertTrue(Message.objects.get(pk=sunday_email.pk).processed_batch_apps)
+
+    def test_process_dates_should_leave_emails_of_unselected_dates_untouched(self):
+        create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 2, 0, tzinfo=pytz.utc))
+        tuesday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 21, 2, 0, tzinfo=pytz.utc))
+        create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 22, 2, 0, tzinfo=pytz.utc))
+
+        execute_end_to_end_tasks_for_dates([datetime.date(2014, 10, 19), datetime.date(2014, 10, 22)])
+
+        self.assertFalse(Message.objects.get(pk=tuesday_email.pk).processed_batch_apps)
+
+    @mock.patch('batch_apps.integration.get_current_date_in_gmt8')
+    def test_execute_end_to_end_tasks_should_work_out_today_when_called(self, mock_today):
+        mock_today.return_value = datetime.date(2014, 10, 20)
+        execute_end_to_end_tasks()
+
+        mock_today.return_value = datetime.date(2014, 10, 27)
+        execute_end_to_end_tasks()
+
+        self.assertEqual(list(Day.objects.order_by('date').values_list('date', flat=True)),
+                         [datetime.date(2014, 10, 20), datetime.date(2014, 10, 27)])
+
+    def test_process_dates_should_skip_days_leased_by_another_worker(self):
+        App.objects.filter(pk=self.app.pk).update(frequency='daily')
+        sunday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 2, 0, tzinfo=pytz.utc))
+        monday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 16, 30, tzinfo=pytz.utc))
+        Lease.objects.acquire(day_lease_key(datetime.date(2014, 10, 20)), 'another-worker', 60)
+
+        report = execute_end_to_end_tasks_for_dates([datetime.date(2014, 10, 19), datetime.date(2014, 10, 20)])
+
+        self.assertEqual((report['days'], report['skipped_days'], report['emails']), (1, 1, 1))
+        self.assertTrue(Message.objects.get(pk=sunday_email.pk).processed_batch_apps)
+        self.assertFalse(Message.objects.get(pk=monday_email.pk).processed_batch_apps)
+        self.assertEqual(list(Lease.objects.values_list('holder', flat=True)), ['another-worker'])
+
+    def test_process_dates_should_stop_when_a_day_lease_is_lost(self):
+        monday_email = create_email(self.mailbox, "Export Done", datetime.datetime(2014, 10, 19, 16, 30, tzinfo=pytz.utc))
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 20)])
+
+        report = {'emails': 0, 'rows_written': 0}
+        match_dates([datetime.date(2014, 10, 20)], report, 'lost-worker')
+
+        self.assertEqual(report['emails'], 0)
+        self.assertFalse(Message.objects.get(pk=monday_email.pk).processed_batch_apps)
+
+
+class UnprocessedEmailQueryPlanTest(TestCase):
+
+    fixtures = ['test_messages.json']
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_daily_query_should_range_scan_the_unprocessed_by_date_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+
+        plan = self.query_plan(get_unprocessed_unmatched_emails(datetime.date(2014, 10, 20)))
+        self.assertIn('USING INDEX django_mailbox_message_unprocessed_by_date (sent_date_local>? AND sent_date_local<?)', plan)
+
+    def test_daily_query_should_keep_using_the_index_with_mailbox_cursors(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+
+        mailbox = Mailbox.objects.get(pk=1)
+        ProcessingCursor.objects.create(mailbox=mailbox, last_message_id=3)
+        Mailbox.objects.create(name="Second Mailbox")
+
+        plan = self.query_plan(get_unprocessed_unmatched_emails(datetime.date(2014, 10, 20)))
+        self.assertIn('USING INDEX django_mailbox_message_unprocessed_by_date', plan)
+
+    def test_streamed_chunk_query_should_keep_using_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+
+        emails = get_unprocessed_unmatched_emails(datetime.date(2014, 10, 20))
+        plan = self.query_plan(emails.filter(id__gt=3).order_by('id').values_list(*EmailRow._fields)[:1000])
+        self.assertIn('USING INDEX django_mailbox_message_unprocessed_by_date', plan)
+
+    def test_rematch_query_should_range_scan_the_unmatched_by_date_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+
+        emails = Message.objects.filter(sent_date_local__range=(datetime.date(2014, 10, 13), datetime.date(2014, 10, 20)))
+        plan = self.query_plan(emails.extra(where=PROCESSED_UNMATCHED_MESSAGE_CONDITION))
+        self.assertIn('USING INDEX django_mailbox_message_unmatched_by_date', plan)
+
+    def test_saved_message_should_store_sent_date_in_gmt8(self):
+        email = Message.objects.get(pk=1)
+        email.sent_time = datetime.datetime(2014, 11, 27, hour=16, minute=0, second=0, tzinfo=pytz.utc)
+        email.save()
+
+        self.assertEqual(Message.objects.get(pk=1).sent_date_local, datetime.date(2014, 11, 28))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_saved_message_with_naive_sent_time_should_read_it_in_time_zone_setting(self):
+        email = Message.objects.get(pk=1)
+        email.sent_time = datetime.datetime(2014, 10, 20, hour=15, minute=0, second=0)
+        email.save()
+
+        self.assertEqual(Message.objects.get(pk=1).sent_date_local, datetime.date(2014, 10, 20))
+        self.assertEqual(Message.objects.get(pk=1).sent_time, datetime.datetime(2014, 10, 20, 15, tzinfo=pytz.utc))
+
+
+class StreamingProcessingTest(TestCase):
+
+    def create_messages(self, mailbox, count, date_):
+        sent_time = datetime.datetime.combine(date_, datetime.time(2, 0)).replace(tzinfo=pytz.utc)
+        Message.objects.bulk_create(
+            Message(mailbox=mailbox,
+                    subject="Batch App - Export Done" if i % 100 == 0 else "Batch App - Report %d" % i,
+                    body="x" * 512,
+                    sent_time=sent_time,
+                    sent_date_local=date_)
+            for i in range(count))
+
+    def peak_memory_processing(self, date_):
+        # tracemalloc stands in for peak RSS: it only sees Python allocations,
+        # not the SQLite page cache or other C level buffers.
+        tracemalloc.start()
+        try:
+            report = execute_end_to_end_tasks(date_)
+            return report, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def assert_peak_memory_does_not_grow(self, small_count, large_count):
+        mailbox = Mailbox.objects.create(name="Batch Apps")
+        create_app_with_pattern()
+        self.create_messages(mailbox, small_count, datetime.date(2014, 10, 20))
+        self.create_messages(mailbox, large_count, datetime.date(2014, 10, 21))
+
+        small_report, small_peak = self.peak_memory_processing(datetime.date(2014, 10, 20))
+        large_report, large_peak = self.peak_memory_processing(datetime.date(2014, 10, 21))
+
+        self.assertEqual(small_report['emails'], small_count)
+        self.assertEqual(large_report['emails'], large_count)
+        self.assertEqual(Message.objects.filter(matched_batch_apps=True).count(), (small_count + large_count) // 100)
+        self.assertLess(large_peak, small_peak * 2)
+
+    def test_peak_memory_should_not_grow_with_the_number_of_messages(self):
+        self.assert_peak_memory_does_not_grow(1000, 10000)
+
+    @skipUnless(os.environ.get('BATCHER_SLOW_TESTS'), 'set BATCHER_SLOW_TESTS to run slow tests')
+    def test_peak_memory_should_not_grow_for_a_hundred_thousand_messages(self):
+        self.assert_peak_memory_does_not_grow(10000, 100000)
+
+
+class BulkMatchWritesTest(TestCase):
+
+    fixtures = ['test_apps.json', 'test_messages.json']
+
+    def test_apply_match_matrix_should_write_with_a_fixed_number_of_updates(self):
+        day = Day.objects.create(date=datetime.date(2014, 10, 20))
+        apps = App.objects.all()[:2]
+        executions = [Execution.objects.create(day=day, app=app, is_due_today=True) for app in apps]
+        emails = list(Message.objects.order_by('id')[:4])
+
+        # Savepoint, matched emails, processed emails, one update per assigned email, release
+        with self.assertNumQueries(6):
+            rows_written = apply_match_matrix([email.id for email in emails], [[apps[0].id], [], [apps[1].id], []],
+                                              {execution.app_id: [execution.id] for execution in executions})
+
+        self.assertEqual(rows_written, 2 + 4 + 2)
+        self.assertEqual(Message.objects.filter(matched_batch_apps=True).count(), 2)
+        self.assertEqual(Execution.objects.get(pk=executions[0].pk).email, emails[0])
+        self.assertEqual(Execution.objects.get(pk=executions[1].pk).email, emails[2])
+        self.assertTrue(Execution.objects.get(pk=executions[1].pk).is_executed)
+
+    def test_apply_match_matrix_should_assign_execution_to_the_last_matching_email(self):
+        day = Day.objects.create(date=datetime.date(2014, 10, 20))
+        app = App.objects.all()[0]
+        execution = Execution.objects.create(day=day, app=app, is_due_today=True)
+        emails = list(Message.objects.order_by('id')[:2])
+
+        apply_match_matrix([email.id for email in emails], [[app.id], [app.id]], {app.id: [execution.id]})
+        self.assertEqual(Execution.objects.get(pk=execution.pk).email, emails[1])
+
+    def test_process_emails_should_report_rows_written_and_wall_time(self):
+        report = execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        self.assertGreater(report['rows_written'], report['emails'])
+        self.assertGreaterEqual(report['seconds'], 0.0)
+
+    def test_describe_report_should_include_rows_written_and_wall_time(self):
+        report = {'emails': 6, 'rows_written': 9, 'seconds': 0.25, 'fingerprint_hit_rate': 0.5}
+        self.assertEqual(describe_report(report),
+                         "6 emails processed, 9 rows written in 0.25s, fingerprint cache hit rate 50.0%")
+
+    def test_describe_report_should_mention_days_leased_by_another_worker(self):
+        report = {'emails': 6, 'rows_written': 9, 'seconds': 0.25, 'fingerprint_hit_rate': 0.5, 'skipped_days': 2}
+        self.assertIn("2 days skipped as leased by another worker", describe_report(report))
+
+
+class ContentMatchingTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+
+    def build_email(self, subject, plain_text):
+        multipart = MIMEMultipart()
+        multipart['Subject'] = subject
+        multipart.attach(MIMEText(plain_text, 'plain'))
+        multipart.attach(MIMEText("<p>Status: SUCCESS</p>", 'html'))
+
+        email = Message(mailbox=self.mailbox, subject=subject,
+                        sent_time=datetime.datetime(2014, 10, 20, 2, 0, tzinfo=pytz.utc))
+        email.set_body(multipart.as_string())
+        email.save()
+        return email
+
+    def test_filter_content_matches_should_drop_apps_whose_content_patterns_fail(self):
+        pattern_set = CompiledPatternSet([
+            (1, "Export Done", False, "", 11),
+            (1, "Status: SUCCESS", False, "", 12, False, False, None, None, 'content'),
+        ])
+        emails = [self.build_email("Export Done", "Status: SUCCESS"),
+                  self.build_email("Export Done", "Status: FAILED")]
+
+        self.assertEqual(filter_content_matches([email.id for email in emails], [[1], [1]], pattern_set), [[1], []])
+
+    def test_filter_content_matches_should_read_the_bodies_of_a_chunk_in_one_query(self):
+        pattern_set = CompiledPatternSet([
+            (1, "Status: SUCCESS", False, "", 12, False, False, None, None, 'content'),
+        ])
+        emails = [self.build_email("Export Done", "Status: SUCCESS") for i in range(5)]
+
+        with self.assertNumQueries(1):
+            match_matrix = filter_content_matches([email.id for email in emails], [[1]] * 5, pattern_set)
+
+        self.assertEqual(match_matrix, [[1]] * 5)
+
+    def test_filter_content_matches_should_skip_emails_deleted_since_they_were_selected(self):
+        pattern_set = CompiledPatternSet([
+            (1, "Status: SUCCESS", False, "", 12, False, False, None, None, 'content'),
+        ])
+        email = self.build_email("Export Done", "Status: SUCCESS")
+        email_id = email.id
+        email.delete()
+
+        self.assertEqual(filter_content_matches([email_id], [[1, 2]], pattern_set), [[2]])
+
+    def test_filter_content_matches_should_not_read_bodies_of_unmatched_emails(self):
+        pattern_set = CompiledPatternSet([
+            (1, "Status: SUCCESS", False, "", 12, False, False, None, None, 'content'),
+        ])
+        email = self.build_email("Export Done", "Status: SUCCESS")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(filter_content_matches([email.id], [[2]], pattern_set), [[2]])
+
+    def test_process_emails_should_confirm_subject_match_with_content_pattern(self):
+        app = create_app_with_pattern()
+        Pattern.objects.create(app=app, name_pattern="Status: SUCCESS", is_active=True, target='content')
+
+        self.build_email("Export Done", "Status: FAILED")
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        self.assertFalse(Execution.objects.get(app=app).is_executed)
+
+        succeeded = self.build_email("Export Done", "Status: SUCCESS")
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        execution = Execution.objects.get(app=app)
+        self.assertTrue(execution.is_executed)
+        self.assertEqual(execution.email, succeeded)
+
+
+class ProcessingCursorTest(TestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox.objects.create(name="Batch Apps")
+        sent_time = datetime.datetime(2014, 10, 20, 2, 0, tzinfo=pytz.utc)
+        self.emails = [create_email(self.mailbox, "Email %d" % i, sent_time) for i in range(4)]
+
+    def test_advance_should_move_watermark_past_processed_messages(self):
+        Message.objects.update(processed_batch_apps=True)
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 20))
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[-1].id)
+
+    def test_advance_should_stop_before_oldest_unprocessed_message(self):
+        Message.objects.exclude(pk=self.emails[2].pk).update(processed_batch_apps=True)
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 20))
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[2].id - 1)
+
+    def test_advance_should_move_empty_mailboxes_up_to_the_newest_message(self):
+        empty_mailbox = Mailbox.objects.create(name="Empty")
+        Message.objects.update(processed_batch_apps=True)
+
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 20))
+
+        self.assertEqual(ProcessingCursor.objects.watermarks()[empty_mailbox.id], self.emails[-1].id)
+        self.assertFalse(ProcessingCursor.objects.unconsidered_messages().exists())
+
+    def test_advance_should_move_past_matched_messages_set_as_unprocessed(self):
+        Message.objects.update(processed_batch_apps=True)
+        Message.objects.filter(pk=self.emails[1].pk).update(matched_batch_apps=True)
+
+        set_as_unprocessed(None, None, Message.objects.filter(pk=self.emails[1].pk))
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 20))
+
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[-1].id)
+
+    def test_advance_should_move_past_messages_dated_outside_scheduled_days(self):
+        Message.objects.update(processed_batch_apps=True)
+        Message.objects.filter(pk=self.emails[1].pk).update(sent_date_local=datetime.date(2014, 10, 17))
+        Message.objects.filter(pk=self.emails[2].pk).update(sent_date_local=datetime.date(2030, 1, 1))
+        Message.objects.filter(pk=self.emails[3].pk).update(sent_date_local=None)
+        Message.objects.filter(pk__in=[self.emails[1].pk, self.emails[2].pk, self.emails[3].pk]).update(
+            processed_batch_apps=False)
+
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 20))
+
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[-1].id)
+
+    def test_advance_should_stop_before_unprocessed_messages_from_the_previous_day(self):
+        Message.objects.exclude(pk=self.emails[2].pk).update(processed_batch_apps=True)
+        ProcessingCursor.objects.advance(datetime.date(2014, 10, 21))
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[2].id - 1)
+
+    def test_processing_a_date_range_should_select_messages_behind_the_cursor(self):
+        create_app_with_pattern("Email 1")
+        ProcessingCursor.objects.create(mailbox=self.mailbox, last_message_id=self.emails[-1].id)
+
+        execute_end_to_end_tasks_for_dates([datetime.date(2014, 10, 20)])
+
+        self.assertTrue(Message.objects.get(pk=self.emails[1].pk).matched_batch_apps)
+
+    def test_unprocessed_emails_should_only_include_messages_above_watermark(self):
+        ProcessingCursor.objects.create(mailbox=self.mailbox, last_message_id=self.emails[1].id)
+
+        results = get_unprocessed_unmatched_emails(datetime.date(2014, 10, 20))
+        self.assertEqual(list(results.order_by('id')), self.emails[2:])
+
+    def test_process_emails_should_advance_cursor(self):
+        create_app_with_pattern("Email 1")
+
+        execute_end_to_end_tasks(datetime.date(2014, 10, 20))
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[-1].id)
+
+    def test_set_as_unprocessed_admin_action_should_rewind_cursor(self):
+        ProcessingCursor.objects.create(mailbox=self.mailbox, last_message_id=self.emails[-1].id)
+        Message.objects.update(processed_batch_apps=True)
+
+        set_as_unprocessed(None, None, Message.objects.filter(pk__in=[self.emails[1].pk, self.emails[2].pk]))
+
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[1].id - 1)
+        results = get_unprocessed_unmatched_emails(datetime.date(2014, 10, 20))
+        self.assertEqual(list(results.order_by('id')), self.emails[1:3])
+
+    def test_rewind_should_never_move_cursor_forward(self):
+        ProcessingCursor.objects.create(mailbox=self.mailbox, last_message_id=self.emails[0].id)
+        ProcessingCursor.objects.rewind(Message.objects.filter(pk=self.emails[3].pk))
+        self.assertEqual(ProcessingCursor.objects.watermarks()[self.mailbox.id], self.emails[0].id)
+
+
 class ExecutionFilteringTest(TestCase):
 
     def test_get_due_executions_should_return_executions_with_correct_date(self):
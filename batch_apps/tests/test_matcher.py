@@ -1,12 +1,36 @@
+from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from batch_apps.management.commands.benchmark_matcher import generate_synthetic_corpus
 
 from batch_apps.matcher import (
+    CompiledPatternSet,
+    FingerprintCache,
+    PatternStats,
+    SenderIndex,
+    SubjectMatcher,
     capture_date,
+    capture_dates,
+    compile_pattern,
+    extract_index_keys,
     match_email_subject_to_app,
     match_subject,
+    match_subjects,
+    normalize_subject,
+    parse_sender_address,
+    parse_senders,
+    scan_dates,
+    subject_fingerprint,
 )
 
-from batch_apps.models import App, Pattern
+from batch_apps.models import App, Pattern, SubjectFingerprint
+
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import datetime
 
 
 class RegularExpressionTest(TestCase):
@@ -78,6 +102,46 @@ class RegularExpressionTest(TestCase):
         supplied_pattern = "dd/mm/yyyy"
         self.assertEqual(capture_date(email_subject, supplied_pattern), None)
 
+    def test_captured_execution_date_should_match_iso_format(self):
+        email_subject = 'Random App run 2014-10-20 done'
+        self.assertEqual(capture_date(email_subject, 'yyyy-mm-dd'), '2014-10-20')
+
+    def test_captured_execution_date_should_match_dash_format(self):
+        email_subject = 'Random App (20-10-2014)'
+        self.assertEqual(capture_date(email_subject, 'dd-mm-yyyy'), '2014-10-20')
+
+    def test_captured_execution_date_should_match_dot_format(self):
+        email_subject = 'Random App 6.11.2014'
+        self.assertEqual(capture_date(email_subject, 'dd.mm.yyyy'), '2014-11-06')
+
+    def test_captured_execution_date_should_match_day_and_month_name_format(self):
+        self.assertEqual(capture_date('Random App 20 Oct 2014', 'dd mon yyyy'), '2014-10-20')
+        self.assertEqual(capture_date('Random App 20th October, 2014', 'dd mon yyyy'), '2014-10-20')
+
+    def test_captured_execution_date_should_only_accept_month_names_and_separators(self):
+        self.assertEqual(capture_date('Random App 20 Sept 2014', 'dd mon yyyy'), '2014-09-20')
+        self.assertIsNone(capture_date('Random App 20 Oct*2014', 'dd mon yyyy'))
+        self.assertIsNone(capture_date('Sync 1 Marketing 2014', 'dd mon yyyy'))
+        self.assertIsNone(capture_date('Sync Marchers 1, 2014', 'mon dd yyyy'))
+
+    def test_captured_execution_date_should_match_month_name_and_day_format(self):
+        self.assertEqual(capture_date('Random App October 20, 2014', 'mon dd yyyy'), '2014-10-20')
+
+    def test_scan_dates_should_find_all_date_shapes_in_one_pass(self):
+        scanned = scan_dates('Run 2014-10-20 for 21/10/2014 and 2210/2014')
+        self.assertEqual(scanned, [
+            ('iso', ('2014', '10', '20')),
+            ('slash', ('21', '10', '2014')),
+            ('noslash', ('22', '10', '2014')),
+        ])
+
+    def test_capture_dates_should_extract_dates_for_a_list_of_subjects(self):
+        email_subjects = ['Random App (20/10/2014)', 'Random App without date', 'Random App (25/25/2015)']
+        self.assertEqual(capture_dates(email_subjects), ['2014-10-20', None, None])
+
+    def test_capture_dates_should_return_none_for_each_subject_with_unknown_format(self):
+        self.assertEqual(capture_dates(['Random App (20/10/2014)'], 'yyyy/dd/mm'), [None])
+
 
 class EmailToAppMatcherTest(TestCase):
 
@@ -140,3 +204,475 @@ class EmailToAppMatcherTest(TestCase):
         Pattern.objects.create(app=app_, name_pattern="007", is_active=True, is_capturing_date=True, date_pattern="")
         email_subject = "Email Subject - App 007 25/02/2015"
         self.assertTrue(match_email_subject_to_app(email_subject, app_))
+
+
+class CompiledPatternSetTest(TestCase):
+
+    def test_pattern_set_should_require_all_patterns_of_an_app_to_match(self):
+        pattern_set = CompiledPatternSet([
+            (1, "ABC", False, ""),
+            (1, "XYZ", False, ""),
+        ])
+        self.assertTrue(pattern_set.match("Email Subject - XYZ pattern and ABC pattern", 1))
+        self.assertFalse(pattern_set.match("Email Subject - XYZ pattern only", 1))
+
+    def test_pattern_set_should_escape_parentheses(self):
+        pattern_set = CompiledPatternSet([(1, "Batch App (internal) Report", False, "")])
+        self.assertTrue(pattern_set.match("Batch App (internal) Report", 1))
+        self.assertFalse(pattern_set.match("Batch App internal Report", 1))
+
+    def test_pattern_set_should_require_captured_date_only_for_date_capturing_patterns(self):
+        pattern_set = CompiledPatternSet([
+            (1, "DEF", True, "dd/mm/yyyy"),
+            (2, "DEF", False, "dd/mm/yyyy"),
+        ])
+        self.assertFalse(pattern_set.match("Email Subject - DEF but date pattern not present", 1))
+        self.assertTrue(pattern_set.match("Email Subject - DEF but date pattern not present", 2))
+
+    def test_pattern_set_should_return_matching_apps_from_given_app_ids(self):
+        pattern_set = CompiledPatternSet([
+            (1, "ABC", False, ""),
+            (2, "XYZ", False, ""),
+            (3, "ABC", False, ""),
+        ])
+        self.assertEqual(pattern_set.match_apps("ABC only", [1, 2]), [1])
+
+    def test_pattern_set_should_load_active_patterns_with_a_single_query(self):
+        app1 = App.objects.create(name='App Identifier 008', is_active=True, frequency='daily')
+        app2 = App.objects.create(name='App Identifier 009', is_active=True, frequency='daily')
+        Pattern.objects.create(app=app1, name_pattern="008", is_active=True)
+        Pattern.objects.create(app=app2, name_pattern="009", is_active=True)
+        Pattern.objects.create(app=app2, name_pattern="Inactive", is_active=False)
+
+        with self.assertNumQueries(1):
+            pattern_set = CompiledPatternSet(Pattern.objects.active_pattern_rows())
+
+        with self.assertNumQueries(0):
+            matched = pattern_set.match_apps("App 009 Success", [app1.id, app2.id])
+
+        self.assertEqual(matched, [app2.id])
+
+
+class TokenIndexTest(TestCase):
+
+    def test_extract_index_keys_should_only_use_pattern_bounded_sides_of_tokens(self):
+        keys = extract_index_keys("Batch App - Listing Refresh ")
+        self.assertIn(('suffix', 'Batch'), keys)
+        self.assertIn(('exact', 'Listing'), keys)
+        self.assertIn(('exact', 'Refresh'), keys)
+
+    def test_extract_index_keys_should_skip_regex_patterns(self):
+        self.assertEqual(extract_index_keys("Report \\d+ rows"), [])
+        self.assertEqual(extract_index_keys("iProperty.com Report"), [])
+
+    def test_extract_index_keys_should_skip_single_unbounded_token(self):
+        self.assertEqual(extract_index_keys("ABC"), [])
+
+    def test_candidates_should_include_apps_whose_pattern_starts_mid_word(self):
+        pattern_set = CompiledPatternSet([(1, "ExpiringNotice Success", False, "")])
+        subject = "Batch App - SGDailyAppTask SendExpiringNotice Success"
+        self.assertIn(1, pattern_set.candidate_app_ids(subject))
+        self.assertEqual(pattern_set.match_apps(subject, [1]), [1])
+
+    def test_candidates_should_exclude_apps_without_shared_token(self):
+        pattern_set = CompiledPatternSet([
+            (1, "SendExpiringNotice Success", False, ""),
+            (2, "doOverseasXML Done", False, ""),
+        ])
+        self.assertEqual(pattern_set.filter_candidates("Batch App - SendExpiringNotice Success", [1, 2]), [1])
+
+    def test_unindexed_apps_should_always_be_candidates(self):
+        pattern_set = CompiledPatternSet([
+            (1, "SendExpiringNotice Success", False, ""),
+            (2, "ABC", False, ""),
+        ])
+        self.assertEqual(pattern_set.filter_candidates("unrelated subject", [1, 2, 3]), [2, 3])
+
+    def test_index_should_reduce_candidates_without_changing_results_on_synthetic_corpus(self):
+        pattern_rows, subjects = generate_synthetic_corpus(app_count=1000, email_count=200)
+        pattern_set = CompiledPatternSet(pattern_rows)
+        app_ids = [row[0] for row in pattern_rows]
+
+        candidates = 0
+        for subject in subjects:
+            candidates += len(pattern_set.filter_candidates(subject, app_ids))
+            expected = [app_id for app_id in app_ids if pattern_set.match(subject, app_id)]
+            self.assertEqual(pattern_set.match_apps(subject, app_ids), expected)
+
+        self.assertLess(candidates / len(subjects), len(app_ids) / 10)
+
+
+class BatchMatchingTest(TestCase):
+
+    def setUp(self):
+        self.pattern_rows = [
+            (1, "SendExpiringNotice Success", False, ""),
+            (2, "doOverseasXML", False, ""),
+            (3, "Listing Archive", True, "ddmm/yyyy"),
+        ]
+        self.subjects = [
+            "Batch App - SGDailyAppTask SendExpiringNotice Success",
+            "Batch App - Listing Archive 2010/2014",
+            "Batch App - Listing Archive without date",
+            "Batch App - SGEChannel doOverseasXML",
+            "Unrelated email",
+        ]
+
+    def test_match_subjects_should_return_matched_apps_per_subject(self):
+        match_matrix = match_subjects(self.subjects, self.pattern_rows, [1, 2, 3])
+        self.assertEqual(match_matrix, [[1], [3], [], [2], []])
+
+    def test_match_subjects_should_only_consider_given_app_ids(self):
+        match_matrix = match_subjects(self.subjects, self.pattern_rows, [1, 3])
+        self.assertEqual(match_matrix, [[1], [3], [], [], []])
+
+    def test_match_subjects_using_process_pool_should_return_results_in_subject_order(self):
+        subjects = self.subjects * 20
+        expected = match_subjects(subjects, self.pattern_rows, [1, 2, 3])
+        match_matrix = match_subjects(subjects, self.pattern_rows, [1, 2, 3], processes=2, chunk_size=7)
+        self.assertEqual(match_matrix, expected)
+
+
+    def test_subject_matcher_should_start_one_process_pool_for_all_chunks_of_a_run(self):
+        subjects = self.subjects * 20
+        expected = match_subjects(subjects, self.pattern_rows, [1, 2, 3])
+
+        with mock.patch('batch_apps.matcher.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            with SubjectMatcher(self.pattern_rows, processes=2, chunk_size=7) as matcher:
+                match_matrix = matcher.match(subjects[:50], [1, 2, 3]) + matcher.match(subjects[50:], [1, 2, 3])
+
+        self.assertEqual(match_matrix, expected)
+        self.assertEqual(pool.call_count, 1)
+
+    def test_subject_matcher_should_only_send_workers_the_fingerprints_of_their_subjects(self):
+        fingerprint_cache = FingerprintCache({'Unrelated email': set(), 'Unused subject': set()})
+
+        with SubjectMatcher(self.pattern_rows, processes=2, chunk_size=2) as matcher:
+            matcher._executor = mock.Mock(wraps=ProcessPoolExecutor(max_workers=2))
+            matcher.match(self.subjects, [1, 2, 3], fingerprint_cache)
+            sent_caches = [call[0][-1] for call in matcher._executor.submit.call_args_list]
+
+        self.assertEqual([set(cache.entries) for cache in sent_caches], [set(), set(), {'Unrelated email'}])
+
+
+class PatternTimeBudgetTest(TestCase):
+
+    def test_pattern_exceeding_time_budget_should_be_interrupted_and_quarantined(self):
+        pattern_rows = [(1, "a*a*a*a*a*a*a*a*a*a*c", False, "", 11), (2, "aaa", False, "", 12)]
+        stats = PatternStats()
+        match_matrix = match_subjects(["a" * 40, "aaa"], pattern_rows, [1, 2],
+                                      time_budget=0.05, stats=stats)
+        self.assertEqual(match_matrix, [[2], [2]])
+        self.assertEqual(stats.quarantined, {11})
+
+    def test_subject_matcher_should_keep_patterns_quarantined_across_chunks(self):
+        pattern_rows = [(1, "a*a*a*a*a*a*a*a*a*a*c", False, "", 11)]
+
+        with SubjectMatcher(pattern_rows, time_budget=0.05) as matcher:
+            matcher.match(["a" * 40], [1])
+            matcher.match(["a" * 40], [1])
+
+        self.assertEqual(matcher.stats.quarantined, {11})
+        self.assertEqual(matcher.stats.by_pattern[11][0], 1)
+
+    def test_uninterrupted_overruns_should_only_quarantine_after_repeated_overruns(self):
+        pattern_set = CompiledPatternSet([(1, "Rep.rt", False, "", 11)], time_budget=1e-9)
+
+        self.assertTrue(pattern_set.match("Daily Report", 1))
+        self.assertNotIn(11, pattern_set.stats.quarantined)
+
+        pattern_set.match("Daily Report", 1)
+        pattern_set.match("Daily Report", 1)
+        self.assertIn(11, pattern_set.stats.quarantined)
+        self.assertFalse(pattern_set.match("Daily Report", 1))
+
+    def test_quarantined_pattern_should_not_be_evaluated_again(self):
+        pattern_set = CompiledPatternSet([(1, "Report", False, "", 11, True)])
+        self.assertFalse(pattern_set.match("Report", 1))
+        self.assertNotIn(11, pattern_set.stats.by_pattern)
+
+    def test_pattern_set_should_record_match_count_hit_count_and_time_per_pattern(self):
+        pattern_set = CompiledPatternSet([(1, "Report", False, "", 11)], time_budget=1)
+        pattern_set.match("Daily Report", 1)
+        pattern_set.match("Daily Digest", 1)
+        match_count, hit_count, match_time = pattern_set.stats.by_pattern[11]
+        self.assertEqual(match_count, 2)
+        self.assertEqual(hit_count, 1)
+        self.assertGreater(match_time, 0)
+
+    def test_pattern_stats_should_be_saved_to_patterns(self):
+        app_ = App.objects.create(name='App Identifier 010', is_active=True, frequency='daily')
+        pattern = Pattern.objects.create(app=app_, name_pattern="010", is_active=True, match_count=3)
+        stats = PatternStats()
+        stats.record(pattern.id, True, 0.5)
+        stats.quarantined.add(pattern.id)
+
+        Pattern.objects.record_match_stats(stats)
+
+        pattern = Pattern.objects.get(pk=pattern.id)
+        self.assertEqual(pattern.match_count, 4)
+        self.assertEqual(pattern.hit_count, 1)
+        self.assertEqual(pattern.match_time, 0.5)
+        self.assertTrue(pattern.is_quarantined)
+
+
+    def test_pattern_stats_should_be_saved_in_a_single_transaction(self):
+        app_ = App.objects.create(name='App Identifier 010', is_active=True, frequency='daily')
+        stats = PatternStats()
+        for i in range(3):
+            stats.record(Pattern.objects.create(app=app_, name_pattern="01%d" % i).id, True, 0.5)
+
+        with CaptureQueriesContext(connection) as context:
+            Pattern.objects.record_match_stats(stats)
+
+        # The SQLite backend reports queries as "QUERY = '...' - PARAMS = ..."
+        statements = [query['sql'].replace("QUERY = '", "", 1).split()[0] for query in context.captured_queries]
+        self.assertEqual(statements, ['SAVEPOINT', 'UPDATE', 'UPDATE', 'UPDATE', 'RELEASE'])
+
+
+class CompiledPatternKindTest(TestCase):
+
+    def test_compile_pattern_should_classify_plain_text_as_literal(self):
+        self.assertEqual(compile_pattern("Batch App (internal) Report"), ('literal', "Batch App (internal) Report"))
+
+    def test_compile_pattern_should_classify_case_insensitive_plain_text_as_folded_literal(self):
+        self.assertEqual(compile_pattern("SendExpiringNotice", True), ('iliteral', "sendexpiringnotice"))
+
+    def test_compile_pattern_should_escape_parentheses_of_regex(self):
+        self.assertEqual(compile_pattern("Report (\\d+)"), ('regex', "Report \\(\\d+\\)"))
+
+    def test_pattern_set_should_match_case_insensitive_literal_regardless_of_case(self):
+        pattern_set = CompiledPatternSet([(1, "sendexpiringnotice SUCCESS", False, "", 11, False, True)])
+        self.assertTrue(pattern_set.match_apps("Batch App - SendExpiringNotice Success", [1]))
+        self.assertFalse(pattern_set.match_apps("Batch App - SendExpiringNotice Failed", [1]))
+
+    def test_pattern_set_should_match_case_insensitive_regex(self):
+        pattern_set = CompiledPatternSet([(1, "report \\d+ rows", False, "", 11, False, True)])
+        self.assertTrue(pattern_set.match_apps("Daily Report 15 Rows", [1]))
+
+    def test_pattern_set_should_quarantine_invalid_stored_regex(self):
+        pattern_set = CompiledPatternSet([(1, "Report [", False, "", 11)])
+        self.assertFalse(pattern_set.match("Report [", 1))
+        self.assertIn(11, pattern_set.stats.quarantined)
+
+    def test_saving_pattern_should_store_kind_and_compiled_form(self):
+        app_ = App.objects.create(name='App Identifier 011', is_active=True, frequency='daily')
+        literal = Pattern.objects.create(app=app_, name_pattern="Identifier 011", is_active=True)
+        regex = Pattern.objects.create(app=app_, name_pattern="Identifier \\d+", is_active=True)
+        self.assertEqual((literal.kind, literal.compiled_pattern), ('literal', "Identifier 011"))
+        self.assertEqual((regex.kind, regex.compiled_pattern), ('regex', "Identifier \\d+"))
+
+    def test_invalid_regex_should_fail_pattern_validation(self):
+        app_ = App.objects.create(name='App Identifier 012', is_active=True, frequency='daily')
+        pattern = Pattern(app=app_, name_pattern="Identifier [012", is_active=True)
+
+        with self.assertRaises(ValidationError) as context:
+            pattern.full_clean()
+
+        self.assertIn('name_pattern', context.exception.message_dict)
+
+
+class SubjectFingerprintTest(TestCase):
+
+    def setUp(self):
+        self.pattern_set = CompiledPatternSet([
+            (1, "SendExpiringNotice Success", False, "", 11),
+            (2, "Listing Archive", True, "ddmm/yyyy", 12),
+            (3, "App Identifier 003", False, "", 13),
+        ])
+
+    def test_subject_fingerprint_should_normalize_digits_and_dates(self):
+        self.assertEqual(subject_fingerprint("Batch App - Listing Archive 2010/2014 (3 files)"),
+                         "Batch App - Listing Archive #/# (# files)")
+
+    def test_known_fingerprint_should_be_answered_from_cache(self):
+        fingerprint_cache = FingerprintCache()
+        self.pattern_set.match_apps("Batch App - SendExpiringNotice Success 20/10/2014", [1], fingerprint_cache)
+        matched = self.pattern_set.match_apps("Batch App - SendExpiringNotice Success 21/10/2014", [1], fingerprint_cache)
+
+        self.assertEqual(matched, [1])
+        self.assertEqual(self.pattern_set.stats.by_pattern[11][0], 1)
+        self.assertEqual((fingerprint_cache.hits, fingerprint_cache.misses), (1, 1))
+        self.assertEqual(fingerprint_cache.hit_rate, 0.5)
+
+    def test_apps_with_digits_or_captured_dates_should_always_be_evaluated(self):
+        fingerprint_cache = FingerprintCache()
+        self.assertEqual(self.pattern_set.match_apps("Listing Archive 2010/2014", [2], fingerprint_cache), [2])
+        self.assertEqual(self.pattern_set.match_apps("Listing Archive 2514/2014", [2], fingerprint_cache), [])
+        self.assertEqual(self.pattern_set.match_apps("App Identifier 003", [3], fingerprint_cache), [3])
+        self.assertEqual(self.pattern_set.match_apps("App Identifier 004", [3], fingerprint_cache), [])
+
+    def test_fingerprint_cache_should_be_saved_and_loaded(self):
+        fingerprint_cache = SubjectFingerprint.objects.load_cache()
+        fingerprint_cache.store("Batch App #", {1, 4})
+        fingerprint_cache.store("Other App #", set())
+
+        SubjectFingerprint.objects.save_cache(fingerprint_cache)
+        SubjectFingerprint.objects.save_cache(fingerprint_cache)
+
+        self.assertEqual(SubjectFingerprint.objects.count(), 2)
+        loaded_cache = SubjectFingerprint.objects.load_cache()
+        SubjectFingerprint.objects.load_entries(loaded_cache, ["Batch App #", "Other App #", "Unknown #"])
+        self.assertEqual(loaded_cache.entries, {"Batch App #": {1, 4}, "Other App #": set()})
+
+    def test_load_entries_should_only_read_requested_fingerprints_once(self):
+        fingerprint_cache = SubjectFingerprint.objects.load_cache()
+        fingerprint_cache.store("Batch App #", {1})
+        fingerprint_cache.store("Other App #", {2})
+        SubjectFingerprint.objects.save_cache(fingerprint_cache)
+
+        loaded_cache = SubjectFingerprint.objects.load_cache()
+        SubjectFingerprint.objects.load_entries(loaded_cache, ["Batch App #"])
+        self.assertEqual(loaded_cache.entries, {"Batch App #": {1}})
+
+        with self.assertNumQueries(0):
+            SubjectFingerprint.objects.load_entries(loaded_cache, ["Batch App #"])
+
+    def test_save_cache_should_discard_entries_computed_before_a_pattern_change(self):
+        app_ = App.objects.create(name='App Identifier 013', is_active=True, frequency='daily')
+        pattern = Pattern.objects.create(app=app_, name_pattern="Identifier", is_active=True)
+        fingerprint_cache = SubjectFingerprint.objects.load_cache()
+        fingerprint_cache.store("App Identifier #", {app_.id})
+
+        pattern.name_pattern = "Identifiers"
+        pattern.save()
+        SubjectFingerprint.objects.save_cache(fingerprint_cache)
+
+        self.assertEqual(SubjectFingerprint.objects.count(), 0)
+
+    def test_fingerprint_cache_should_be_invalidated_when_a_pattern_changes(self):
+        app_ = App.objects.create(name='App Identifier 013', is_active=True, frequency='daily')
+        pattern = Pattern.objects.create(app=app_, name_pattern="Identifier", is_active=True)
+        SubjectFingerprint.objects.create(fingerprint="App Identifier #", app_ids=str(app_.id))
+
+        pattern.is_active = False
+        pattern.save()
+
+        self.assertEqual(SubjectFingerprint.objects.count(), 0)
+
+    def test_fingerprint_cache_should_be_invalidated_when_an_app_is_deactivated(self):
+        app_ = App.objects.create(name='App Identifier 014', is_active=True, frequency='daily')
+        SubjectFingerprint.objects.create(fingerprint="App Identifier #", app_ids=str(app_.id))
+
+        app_.description = 'Unrelated change'
+        app_.save()
+        self.assertEqual(SubjectFingerprint.objects.count(), 1)
+
+        app_.is_active = False
+        app_.save()
+        self.assertEqual(SubjectFingerprint.objects.count(), 0)
+
+
+class NormalizedSubjectTest(TestCase):
+
+    def test_normalize_subject_should_apply_nfkc_casefold_and_collapse_whitespace(self):
+        self.assertEqual(normalize_subject("  Batch\tApp  －  ＳｅｎｄＥｘｐｉｒｉｎｇ\nNotice STRASSE "),
+                         "batch app - sendexpiring notice strasse")
+
+    def test_case_insensitive_mode_should_match_literals_against_normalized_subject(self):
+        pattern_set = CompiledPatternSet([(1, "SendExpiringNotice  Success", False, "", 11)], case_insensitive=True)
+        self.assertEqual(pattern_set.match_apps("BATCH APP - SENDEXPIRINGNOTICE SUCCESS", [1]), [1])
+
+    def test_case_insensitive_mode_should_use_supplied_normalized_subject(self):
+        pattern_set = CompiledPatternSet([(1, "SendExpiringNotice Success", False, "", 11)], case_insensitive=True)
+        self.assertEqual(pattern_set.match_apps("not normalized", [1], normalized_subject="sendexpiringnotice success"), [1])
+
+    def test_case_insensitive_mode_should_ignore_case_of_regex(self):
+        pattern_set = CompiledPatternSet([(1, "Report \\d+ rows", False, "", 11)], case_insensitive=True)
+        self.assertEqual(pattern_set.match_apps("DAILY REPORT 15 ROWS", [1]), [1])
+
+    def test_case_sensitive_mode_should_keep_literals_case_sensitive(self):
+        pattern_set = CompiledPatternSet([(1, "SendExpiringNotice Success", False, "", 11)])
+        self.assertEqual(pattern_set.match_apps("BATCH APP - SENDEXPIRINGNOTICE SUCCESS", [1]), [])
+
+    def test_normalized_literals_should_be_prefiltered_by_normalized_tokens(self):
+        pattern_set = CompiledPatternSet([
+            (1, "SendExpiringNotice Success", False, "", 11),
+            (2, "doOverseasXML Done", False, "", 12),
+        ], case_insensitive=True)
+        self.assertEqual(pattern_set.filter_candidates("x", [1, 2], "batch app - sendexpiringnotice success"), [1])
+
+    def test_match_subjects_should_pass_normalized_subjects(self):
+        match_matrix = match_subjects(["A", "B"], [(1, "Success", False, "")], [1],
+                                      normalized_subjects=["success", "failure"], case_insensitive=True)
+        self.assertEqual(match_matrix, [[1], []])
+
+
+class ContentPatternTest(TestCase):
+
+    def content_row(self, app_id, name_pattern, pattern_id):
+        return (app_id, name_pattern, False, "", pattern_id, False, False, None, None, 'content')
+
+    def test_content_patterns_should_not_affect_subject_matching(self):
+        pattern_set = CompiledPatternSet([
+            (1, "SendExpiringNotice Success", False, "", 11),
+            self.content_row(1, "Status: SUCCESS", 12),
+        ])
+        self.assertEqual(pattern_set.match_apps("Batch App - SendExpiringNotice Success", [1]), [1])
+        self.assertEqual(pattern_set.content_app_ids, set([1]))
+
+    def test_match_content_should_require_every_content_pattern(self):
+        pattern_set = CompiledPatternSet([
+            self.content_row(1, "Status: SUCCESS", 11),
+            self.content_row(1, "Rows processed: \\d+", 12),
+        ])
+        self.assertTrue(pattern_set.match_content("Rows processed: 42\nStatus: SUCCESS", 1))
+        self.assertFalse(pattern_set.match_content("Rows processed: none\nStatus: SUCCESS", 1))
+
+    def test_match_content_should_pass_apps_without_content_patterns(self):
+        pattern_set = CompiledPatternSet([(1, "SendExpiringNotice Success", False, "", 11)])
+        self.assertTrue(pattern_set.match_content("anything", 1))
+
+    def test_match_content_should_ignore_case_in_case_insensitive_mode(self):
+        pattern_set = CompiledPatternSet([self.content_row(1, "Status: SUCCESS", 11)], case_insensitive=True)
+        self.assertTrue(pattern_set.match_content("status:   success", 1))
+
+    def test_pattern_manager_rows_should_carry_target(self):
+        app = App.objects.create(name="My App 001")
+        Pattern.objects.create(app=app, name_pattern="Status: SUCCESS", is_active=True, target='content')
+
+        pattern_set = CompiledPatternSet(Pattern.objects.active_pattern_rows())
+        self.assertEqual(pattern_set.content_app_ids, set([app.id]))
+
+
+class SenderIndexTest(TestCase):
+
+    def test_parse_senders_should_accept_addresses_and_domains_in_any_case(self):
+        self.assertEqual(parse_senders("Batch01@Hosts.example.com, @Hosts2.Example.com;\nhosts3.example.com"),
+                         ["batch01@hosts.example.com", "hosts2.example.com", "hosts3.example.com"])
+
+    def test_parse_sender_address_should_return_lowercase_address(self):
+        self.assertEqual(parse_sender_address("Batch Host <Batch01@Hosts.Example.com>"), "batch01@hosts.example.com")
+
+    def test_sender_index_should_keep_only_apps_tied_to_sender_or_domain(self):
+        sender_index = SenderIndex([(1, "batch01@hosts.example.com"), (2, "@hosts.example.com"), (3, "other.example.com")])
+        self.assertEqual(sender_index.filter_app_ids("batch01@hosts.example.com", [1, 2, 3]), [1, 2])
+        self.assertEqual(sender_index.filter_app_ids("batch02@hosts.example.com", [1, 2, 3]), [2])
+
+    def test_sender_index_should_keep_apps_without_declared_senders(self):
+        sender_index = SenderIndex([(1, "batch01@hosts.example.com")])
+        self.assertEqual(sender_index.filter_app_ids("someone@else.example.com", [1, 2]), [2])
+
+    def test_sender_index_should_not_filter_messages_without_sender(self):
+        sender_index = SenderIndex([(1, "batch01@hosts.example.com")])
+        self.assertEqual(sender_index.filter_app_ids("", [1, 2]), [1, 2])
+
+    def test_match_subjects_should_only_consider_apps_tied_to_the_sender(self):
+        pattern_rows = [(1, "Export Done", False, ""), (2, "Export Done", False, "")]
+        match_matrix = match_subjects(["Export Done", "Export Done"], pattern_rows, [1, 2],
+                                      sender_addresses=["batch01@hosts.example.com", "batch02@hosts.example.com"],
+                                      app_senders=[(1, "batch01@hosts.example.com"), (2, "batch02@hosts.example.com")])
+        self.assertEqual(match_matrix, [[1], [2]])
+
+
+class CapturedDateTest(TestCase):
+
+    def test_captured_date_should_return_date_of_the_date_capturing_pattern(self):
+        pattern_set = CompiledPatternSet([(1, "Export Done", False, "", 11), (1, "run for", True, "dd/mm/yyyy", 12)])
+        self.assertEqual(pattern_set.captured_date("Export Done, run for 20/10/2014", 1), datetime.date(2014, 10, 20))
+        self.assertEqual(pattern_set.date_capturing_app_ids, set([1]))
+
+    def test_captured_date_should_be_none_without_date_capturing_pattern(self):
+        pattern_set = CompiledPatternSet([(1, "Export Done", False, "", 11)])
+        self.assertIsNone(pattern_set.captured_date("Export Done, run for 20/10/2014", 1))
+        self.assertEqual(pattern_set.date_capturing_app_ids, set())
@@ -1,8 +1,13 @@
+from django.db import IntegrityError, connection
 from django.test import TestCase
-from django_mailbox.models import Message
-from batch_apps.models import App, Day, Execution
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_mailbox.models import Mailbox, Message
+from batch_apps.models import BULK_INSERT_ATTEMPTS, App, Day, Execution, Lease, MaterializedSchedule, ScheduleRule
 from batch_apps.generator import get_current_date_in_gmt8
+from unittest import mock
 import datetime
+import email
 
 
 class MessageModelTest(TestCase):
@@ -27,6 +32,33 @@ class MessageModelTest(TestCase):
         expected_object = datetime.datetime.strptime("2014-10-20 10:31:25 +0800", "%Y-%m-%d %H:%M:%S %z")
         self.assertEqual(email.sent_time, expected_object)
 
+    def test_incoming_message_should_store_normalized_subject(self):
+        mailbox = Mailbox.objects.get(pk=1)
+        raw_message = email.message_from_string(
+            "Subject: Batch App -  SGDailyAppTask   SendExpiringNotice SUCCESS\n"
+            "From: The Sender <sender@domain.com>\n"
+            "Date: Mon, 20 Oct 2014 10:31:25 +0800\n"
+            "\n"
+            "body\n")
+
+        message = mailbox.process_incoming_message(raw_message)
+
+        self.assertEqual(Message.objects.get(pk=message.pk).subject_normalized,
+                         "batch app - sgdailyapptask sendexpiringnotice success")
+
+    def test_incoming_message_should_store_lowercase_sender_address(self):
+        mailbox = Mailbox.objects.get(pk=1)
+        raw_message = email.message_from_string(
+            "Subject: Batch App - SGDailyAppTask SendExpiringNotice Success\n"
+            "From: Batch Host 01 <Batch01@Hosts.Example.com>\n"
+            "Date: Mon, 20 Oct 2014 10:31:25 +0800\n"
+            "\n"
+            "body\n")
+
+        message = mailbox.process_incoming_message(raw_message)
+
+        self.assertEqual(Message.objects.get(pk=message.pk).sender_address, "batch01@hosts.example.com")
+
 
 class DayModelTest(TestCase):
 
@@ -140,8 +172,200 @@ class GenerateExecutionTest_Execution_ModelManagerTest(TestCase):
         execution = Execution.objects._get_or_create_execution_object(day, app)
         self.assertFalse(execution.is_due_today)
 
-    def test_get_day_of_week_from_string(self):
-        self.assertEqual(Execution.objects._get_day_of_week_from_string('monday'), 'Monday')
+    def test_generate_executions_for_dates_should_create_days_and_executions_in_bulk(self):
+        daily = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        weekly = App.objects.create(name='My App 002', is_active=True, frequency='weekly monday')
+        App.objects.create(name='My Inactive App 001', is_active=False, frequency='daily')
+        dates = [datetime.date(2014, 10, 19), datetime.date(2014, 10, 20), datetime.date(2014, 10, 21)]
+
+        created = Execution.objects.generate_executions_for_dates(dates)
+
+        self.assertEqual(created, 6)
+        self.assertEqual(Day.objects.filter(date__in=dates).count(), 3)
+        self.assertEqual(Execution.objects.filter(app=daily, is_due_today=True).count(), 3)
+        self.assertEqual(list(Execution.objects.filter(app=weekly, is_due_today=True).values_list('day__date', flat=True)),
+                         [datetime.date(2014, 10, 20)])
+
+    def test_generate_executions_for_dates_should_not_duplicate_existing_executions(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        day = Execution.objects._get_or_create_day_object(datetime.date(2014, 10, 20))
+        Execution.objects._get_or_create_execution_object(day, app)
+
+        created = Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 20), datetime.date(2014, 10, 21)])
+
+        self.assertEqual(created, 1)
+        self.assertEqual(Execution.objects.filter(app=app).count(), 2)
+
+    def test_execution_should_be_unique_per_day_and_app(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        day = Day.objects.create(date=datetime.date(2014, 10, 20))
+        Execution.objects.create(day=day, app=app)
+
+        with self.assertRaises(IntegrityError):
+            Execution.objects.create(day=day, app=app, is_due_today=True)
+
+    def test_generate_and_return_execution_objects_should_not_issue_queries_per_app(self):
+        def count_queries(date_):
+            with CaptureQueriesContext(connection) as context:
+                Execution.objects.generate_and_return_active_apps_execution_objects(date_)
+            return len(context.captured_queries)
+
+        for i in range(2):
+            App.objects.create(name='My App %03d' % i, is_active=True, frequency='daily')
+        few_apps_queries = count_queries(datetime.date(2014, 10, 20))
+
+        for i in range(2, 50):
+            App.objects.create(name='My App %03d' % i, is_active=True, frequency='daily')
+        many_apps_queries = count_queries(datetime.date(2014, 10, 21))
+
+        self.assertEqual(few_apps_queries, many_apps_queries)
+        self.assertEqual(Execution.objects.filter(day__date=datetime.date(2014, 10, 21)).count(), 50)
+
+    def test_generate_and_return_execution_objects_should_keep_existing_execution_when_due_date_changed(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        Execution.objects.generate_and_return_active_apps_execution_objects(datetime.date(2014, 10, 20))
+        App.objects.filter(pk=app.pk).update(frequency='weekly - tuesdays')
+
+        executions = Execution.objects.generate_and_return_active_apps_execution_objects(datetime.date(2014, 10, 20))
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(executions[0].is_due_today)
+
+    def test_generate_executions_should_retry_a_rejected_bulk_insert_a_few_times_then_raise(self):
+        App.objects.create(name='My App 001', is_active=True, frequency='daily')
+
+        with mock.patch.object(Execution.objects, 'bulk_create', side_effect=IntegrityError) as bulk_create:
+            with self.assertRaises(IntegrityError):
+                Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 20)])
+
+        self.assertEqual(bulk_create.call_count, BULK_INSERT_ATTEMPTS)
+
+    def test_get_or_create_day_objects_should_retry_a_rejected_bulk_insert_a_few_times_then_raise(self):
+        with mock.patch.object(Day.objects, 'bulk_create', side_effect=IntegrityError) as bulk_create:
+            with self.assertRaises(IntegrityError):
+                Execution.objects._get_or_create_day_objects([datetime.date(2014, 10, 20)])
+
+        self.assertEqual(bulk_create.call_count, BULK_INSERT_ATTEMPTS)
+
+
+class LeaseManagerTest(TestCase):
+
+    def test_acquire_should_refuse_a_lease_held_by_another_worker(self):
+        self.assertTrue(Lease.objects.acquire('day:2014-10-20', 'worker-1', 60))
+        self.assertFalse(Lease.objects.acquire('day:2014-10-20', 'worker-2', 60))
+        self.assertTrue(Lease.objects.acquire('day:2014-10-20', 'worker-1', 60))
+
+    def test_acquire_should_take_over_an_expired_lease(self):
+        Lease.objects.acquire('day:2014-10-20', 'worker-1', 60)
+        Lease.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+        self.assertTrue(Lease.objects.acquire('day:2014-10-20', 'worker-2', 60))
+        self.assertEqual(Lease.objects.get(key='day:2014-10-20').holder, 'worker-2')
+
+    def test_heartbeat_should_only_renew_unexpired_leases_of_the_holder(self):
+        Lease.objects.acquire('day:2014-10-20', 'worker-1', 60)
+        Lease.objects.acquire('day:2014-10-21', 'worker-1', 60)
+        Lease.objects.acquire('day:2014-10-22', 'worker-2', 60)
+        Lease.objects.filter(key='day:2014-10-21').update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+        self.assertEqual(Lease.objects.heartbeat('worker-1', 60), 1)
+
+    def test_release_should_only_delete_leases_of_the_holder(self):
+        Lease.objects.acquire('mailbox:1', 'worker-1', 60)
+        Lease.objects.acquire('mailbox:2', 'worker-2', 60)
+
+        Lease.objects.release('worker-1')
+
+        self.assertEqual(list(Lease.objects.values_list('key', flat=True)), ['mailbox:2'])
+
+
+class MaterializeExecutionsTest(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date(2014, 10, 20)
+        self.daily = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        self.weekly = App.objects.create(name='My App 002', is_active=True, frequency='weekly - mondays')
+
+    def test_materialize_should_create_executions_for_the_whole_horizon(self):
+        report = Execution.objects.materialize(self.today, 6)
+
+        self.assertEqual((report['apps'], report['created']), (2, 14))
+        self.assertEqual(Execution.objects.filter(app=self.weekly, is_due_today=True).count(), 1)
+        self.assertEqual(MaterializedSchedule.objects.get(app=self.daily).materialized_until,
+                         datetime.date(2014, 10, 26))
+
+    def test_materialize_should_do_nothing_when_no_schedule_changed(self):
+        Execution.objects.materialize(self.today, 6)
+        report = Execution.objects.materialize(self.today, 6)
+        self.assertEqual(report, {'apps': 0, 'created': 0, 'updated': 0, 'removed': 0})
+
+    def test_materialize_should_only_append_the_days_the_horizon_moved_by(self):
+        Execution.objects.materialize(self.today, 6)
+        report = Execution.objects.materialize(self.today + datetime.timedelta(days=1), 6)
+
+        self.assertEqual((report['apps'], report['created']), (2, 2))
+        self.assertTrue(Execution.objects.filter(day__date=datetime.date(2014, 10, 27)).exists())
+
+    def test_materialize_should_refresh_only_apps_whose_schedule_changed(self):
+        Execution.objects.materialize(self.today, 6)
+        ScheduleRule.objects.create(app=self.weekly, kind='weekdays', value='tue')
+
+        report = Execution.objects.materialize(self.today, 6)
+
+        self.assertEqual((report['apps'], report['created'], report['updated']), (1, 0, 2))
+        self.assertEqual(list(Execution.objects.filter(app=self.weekly, is_due_today=True)
+                              .values_list('day__date', flat=True)), [datetime.date(2014, 10, 21)])
+
+    def test_materialize_should_never_change_executed_executions(self):
+        Execution.objects.materialize(self.today, 6)
+        Execution.objects.filter(app=self.weekly, day__date=self.today).update(is_executed=True)
+        App.objects.filter(pk=self.weekly.pk).update(frequency='weekly - tuesdays')
+
+        Execution.objects.materialize(self.today, 6)
+
+        self.assertTrue(Execution.objects.get(app=self.weekly, day__date=self.today).is_due_today)
+
+    def test_materialize_should_remove_future_executions_of_deactivated_apps(self):
+        Execution.objects.materialize(self.today, 6)
+        App.objects.filter(pk=self.daily.pk).update(is_active=False)
+
+        report = Execution.objects.materialize(self.today, 6)
+
+        self.assertEqual(report['removed'], 6)
+        self.assertEqual(list(Execution.objects.filter(app=self.daily).values_list('day__date', flat=True)),
+                         [self.today])
+        self.assertFalse(MaterializedSchedule.objects.filter(app=self.daily).exists())
+
+    def test_refresh_apps_should_not_issue_queries_per_unchanged_app(self):
+        def count_queries(app):
+            with CaptureQueriesContext(connection) as context:
+                Execution.objects.refresh_apps([app.id], self.today)
+            return len(context.captured_queries)
+
+        Execution.objects.materialize(self.today, 6)
+        few_apps_queries = count_queries(self.daily)
+
+        for i in range(3, 50):
+            App.objects.create(name='My App %03d' % i, is_active=True, frequency='daily')
+        Execution.objects.materialize(self.today, 6)
+        many_apps_queries = count_queries(self.daily)
+
+        self.assertEqual(few_apps_queries, many_apps_queries)
+
+    def test_refresh_apps_should_only_read_schedule_rules_of_the_given_apps(self):
+        ScheduleRule.objects.create(app=self.weekly, kind='weekdays', value='tue')
+
+        with CaptureQueriesContext(connection) as context:
+            Execution.objects.refresh_apps([self.daily.id], self.today)
+
+        rule_queries = [query['sql'] for query in context.captured_queries
+                        if 'FROM "batch_apps_schedulerule"' in query['sql']]
+        self.assertTrue(rule_queries)
+        for sql in rule_queries:
+            self.assertIn('"batch_apps_schedulerule"."app_id" IN', sql)
+
+    def test_refresh_apps_should_cover_today_when_nothing_is_materialized(self):
+        report = Execution.objects.refresh_apps([self.daily.id], self.today)
 
-    def test_get_day_of_month_from_string(self):
-        self.assertEqual(Execution.objects._get_day_of_month_from_string('01'), '01')
+        self.assertEqual((report['apps'], report['created']), (1, 1))
+        self.assertEqual(list(Execution.objects.values_list('app_id', 'day__date')), [(self.daily.id, self.today)])
@@ -0,0 +1,115 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from batch_apps.models import App, Day, Execution, ScheduleRule
+from batch_apps.schedule import compile_frequency, compile_rule, compile_schedule, due_dates_by_app
+
+import datetime
+import time
+
+
+def due_dates(schedule, start_date, end_date):
+    return sorted(schedule.due_dates(start_date, end_date))
+
+
+class ScheduleRuleCompilationTest(TestCase):
+
+    def test_weekdays_rule_should_return_every_listed_weekday_in_range(self):
+        schedule = compile_schedule('', (('weekdays', 'mon, thursday', None),))
+        self.assertEqual(due_dates(schedule, datetime.date(2014, 10, 16), datetime.date(2014, 10, 27)),
+                         [datetime.date(2014, 10, 16), datetime.date(2014, 10, 20),
+                          datetime.date(2014, 10, 23), datetime.date(2014, 10, 27)])
+
+    def test_days_of_month_rule_should_skip_months_without_that_day(self):
+        schedule = compile_schedule('', (('days_of_month', '29, 31', None),))
+        self.assertEqual(due_dates(schedule, datetime.date(2015, 1, 1), datetime.date(2015, 3, 31)),
+                         [datetime.date(2015, 1, 29), datetime.date(2015, 1, 31),
+                          datetime.date(2015, 3, 29), datetime.date(2015, 3, 31)])
+
+    def test_last_business_day_rule_should_move_back_from_weekends_and_excluded_dates(self):
+        schedule = compile_schedule('', (('last_business_day', '', None),
+                                         ('exclude_dates', '2014-12-31', None)))
+        self.assertEqual(due_dates(schedule, datetime.date(2014, 11, 1), datetime.date(2014, 12, 31)),
+                         [datetime.date(2014, 11, 28), datetime.date(2014, 12, 30)])
+
+    def test_every_n_days_rule_should_count_from_its_start_date(self):
+        schedule = compile_schedule('', (('every_n_days', '3', datetime.date(2014, 10, 1)),))
+        self.assertEqual(due_dates(schedule, datetime.date(2014, 10, 5), datetime.date(2014, 10, 12)),
+                         [datetime.date(2014, 10, 7), datetime.date(2014, 10, 10)])
+
+    def test_every_n_days_rule_should_not_be_due_before_its_start_date(self):
+        schedule = compile_schedule('', (('every_n_days', '2', datetime.date(2014, 10, 10)),))
+        self.assertEqual(due_dates(schedule, datetime.date(2014, 10, 1), datetime.date(2014, 10, 13)),
+                         [datetime.date(2014, 10, 10), datetime.date(2014, 10, 12)])
+
+    def test_exclude_dates_should_also_apply_to_the_frequency_string(self):
+        schedule = compile_schedule('daily', (('exclude_dates', '2014-10-21 2014-10-22', None),))
+        self.assertEqual(due_dates(schedule, datetime.date(2014, 10, 20), datetime.date(2014, 10, 23)),
+                         [datetime.date(2014, 10, 20), datetime.date(2014, 10, 23)])
+
+    def test_frequency_strings_should_compile_to_equivalent_rules(self):
+        self.assertTrue(compile_schedule('weekly - mondays').is_due(datetime.date(2014, 10, 20)))
+        self.assertFalse(compile_schedule('weekly - mondays').is_due(datetime.date(2014, 10, 21)))
+        self.assertTrue(compile_schedule('monthly - day 28').is_due(datetime.date(2014, 10, 28)))
+        self.assertFalse(compile_schedule('monthly - day 28').is_due(datetime.date(2014, 10, 18)))
+        self.assertIsNone(compile_frequency(''))
+
+    def test_compile_frequency_should_recognise_weekday_names_in_any_case(self):
+        self.assertEqual(compile_frequency('Weekly - MONDAY').weekdays, [0])
+
+    def test_compile_frequency_should_recognise_day_of_month(self):
+        self.assertEqual(compile_frequency('monthly - day 01').days, [1])
+
+    def test_compile_frequency_should_recognise_days_28_and_29(self):
+        self.assertEqual(compile_frequency('monthly - day 28').days, [28])
+        self.assertEqual(compile_frequency('monthly - day 29').days, [29])
+
+    def test_identical_schedules_should_compile_to_the_same_object(self):
+        self.assertIs(compile_schedule('daily'), compile_schedule('daily'))
+
+    def test_invalid_rules_should_raise_value_error(self):
+        with self.assertRaises(ValueError):
+            compile_rule('weekdays', 'someday')
+
+        with self.assertRaises(ValueError):
+            compile_rule('every_n_days', '3')
+
+    def test_due_dates_for_a_year_across_many_apps_should_compute_quickly(self):
+        frequencies = ['daily', 'weekly - mondays', 'weekly - fridays', 'monthly - day 01', 'monthly - day 15']
+        schedules_by_app = dict((app_id, compile_schedule(frequencies[app_id % len(frequencies)]))
+                                for app_id in range(1000))
+
+        start = time.time()
+        due = due_dates_by_app(schedules_by_app, datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(len(due[0]), 365)
+        self.assertEqual(len(due[3]), 12)
+
+
+class ScheduleRuleModelTest(TestCase):
+
+    def test_schedule_rules_should_replace_app_frequency_when_generating_executions(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        ScheduleRule.objects.create(app=app, kind='last_business_day')
+
+        Execution.objects.generate_executions_for_dates([datetime.date(2014, 10, 30), datetime.date(2014, 10, 31)])
+
+        self.assertEqual(list(Execution.objects.filter(is_due_today=True).values_list('day__date', flat=True)),
+                         [datetime.date(2014, 10, 31)])
+
+    def test_app_due_today_should_use_schedule_rules(self):
+        app = App.objects.create(name='My App 001', is_active=True, frequency='daily')
+        ScheduleRule.objects.create(app=app, kind='exclude_dates', value='2014-10-20')
+        day = Day.objects.create(date=datetime.date(2014, 10, 20))
+
+        self.assertFalse(Execution.objects._get_or_create_execution_object(day, app).is_due_today)
+
+    def test_clean_should_reject_invalid_rule_values(self):
+        app = App.objects.create(name='My App 001', is_active=True)
+
+        with self.assertRaises(ValidationError):
+            ScheduleRule(app=app, kind='days_of_month', value='32').clean()
+
+        with self.assertRaises(ValidationError):
+            ScheduleRule(app=app, kind='exclude_dates', value='20/10/2014').clean()
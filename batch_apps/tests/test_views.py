@@ -1,7 +1,9 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
-from batch_apps.models import App
+from batch_apps.models import App, Day, Execution
 
 from batch_apps.generator import (
     date_to_str,
@@ -25,6 +27,12 @@ class LoggedInUserTest(TestCase):
         self.client.login(username=self.user.username, password='pass001')
 
 
+def write_queries(captured_queries):
+    # The SQLite backend reports queries as "QUERY = '...' - PARAMS = ..."
+    statements = [query['sql'].replace("QUERY = '", "", 1) for query in captured_queries]
+    return [sql for sql in statements if sql.split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE', 'SAVEPOINT')]
+
+
 class DailyExecutionsViewTest(LoggedInUserTest):
 
     def test_executions_view_renders_executions_template(self):
@@ -65,6 +73,24 @@ class DailyExecutionsViewTest(LoggedInUserTest):
         link = reverse('admin:batch_apps_app_change', args=[app1.id])
         self.assertContains(response, link)
 
+    def test_execution_view_should_not_write_to_the_database(self):
+        App.objects.create(name='Daily App 001', is_active=True, frequency='daily')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(day_url + '2014-10-25/')
+
+        self.assertContains(response, 'is_due_True is_executed_False')
+        self.assertEqual(write_queries(context.captured_queries), [])
+        self.assertFalse(Execution.objects.exists())
+
+    def test_execution_view_should_show_stored_executions(self):
+        app1 = App.objects.create(name='Daily App 001', is_active=True, frequency='daily')
+        day = Day.objects.create(date=datetime.date(2014, 10, 25))
+        Execution.objects.create(day=day, app=app1, is_due_today=True, is_executed=True)
+
+        response = self.client.get(day_url + '2014-10-25/')
+        self.assertContains(response, 'is_due_True is_executed_True')
+
 
 class WeeklyExecutionsViewTest(LoggedInUserTest):
 
@@ -104,6 +130,32 @@ class WeeklyExecutionsViewTest(LoggedInUserTest):
         self.assertContains(response, 'Weekly App 001')
         self.assertContains(response, 'is_due_False is_executed_False', count=6)
 
+    def test_weekly_executions_view_should_not_issue_queries_per_app(self):
+        for i in range(3):
+            App.objects.create(name='Daily App %03d' % i, is_active=True, frequency='daily')
+        with CaptureQueriesContext(connection) as few_apps:
+            self.client.get(week_url + '2014-10-25/')
+
+        for i in range(3, 20):
+            App.objects.create(name='Daily App %03d' % i, is_active=True, frequency='daily')
+        with CaptureQueriesContext(connection) as many_apps:
+            self.client.get(week_url + '2014-11-01/')
+
+        self.assertEqual(len(few_apps.captured_queries), len(many_apps.captured_queries))
+
+    def test_weekly_executions_view_should_not_write_to_the_database(self):
+        app1 = App.objects.create(name='Weekly App 001', is_active=True, frequency='weekly - wednesdays')
+        day = Day.objects.create(date=datetime.date(2014, 10, 22))
+        Execution.objects.create(day=day, app=app1, is_due_today=True, is_executed=True)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(week_url + '2014-10-25/')
+
+        self.assertContains(response, 'is_due_True is_executed_True', count=1)
+        self.assertContains(response, 'is_due_False is_executed_False', count=6)
+        self.assertEqual(write_queries(context.captured_queries), [])
+        self.assertEqual(Execution.objects.count(), 1)
+
     def test_weekly_execution_view_should_redirect_to_today_full_date_url_if_not_specified(self):
         today = get_current_date_in_gmt8()
         response = self.client.get(week_url)
@@ -3,7 +3,7 @@ from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect
-from batch_apps.models import App, Execution
+from batch_apps.models import Execution
 
 from batch_apps.generator import (
     date_from_str,
@@ -34,7 +34,8 @@ def specific_date(request, yyyy_mm_dd=None):
     if date_ > today():
         return HttpResponseNotFound("<h1>Page not found - Can not show date more than today</h1>")
     else:
-        executions_list = Execution.objects.generate_and_return_active_apps_execution_objects(date_)
+        active_apps, executions_by_key = Execution.objects.active_apps_executions_between(date_, date_)
+        executions_list = [executions_by_key[(app.id, date_)] for app in active_apps]
         context = {'date': date_, 'executions_list': executions_list}
         return render(request, 'executions_day.html', context)
 
@@ -66,16 +67,13 @@ def construct_weekly_execution_matrix(date_):
     execution_matrix = []
 
     dates = generate_one_week_date(date_)
-    for date in dates:
-        Execution.objects.generate_and_return_active_apps_execution_objects(date)
+    active_apps, executions_by_key = Execution.objects.active_apps_executions_between(dates[0], dates[-1])
 
-    active_apps = App.objects.filter(is_active=True)
     for app in active_apps:
         app_executions_for_a_week = []
 
         for date in dates:
-            app_executions_for_a_week.append(
-                Execution.objects.filter(app=app, day__date=date))
+            app_executions_for_a_week.append([executions_by_key[(app.id, date)]])
 
         execution_matrix.append(app_executions_for_a_week)
 
@@ -89,3 +89,33 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.7/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Batch apps matching
+
+# Worker processes used to match large email backlogs, None to match in-process
+BATCHER_MATCHING_PROCESSES = None
+
+# Seconds a single pattern may spend on one subject before it is quarantined
+BATCHER_PATTERN_TIME_BUDGET = 0.1
+
+# Match literal patterns against the normalized (NFKC, casefolded) subject
+BATCHER_CASE_INSENSITIVE_MATCHING = False
+
+# Bytes of a message body decoded when matching text/plain content patterns
+BATCHER_CONTENT_SCAN_LIMIT = 64 * 1024
+
+# Match each email against the day's due executions as soon as it is fetched
+BATCHER_REALTIME_MATCHING = False
+
+# Days of already processed, unmatched emails re-checked after a Pattern is saved
+BATCHER_REMATCH_LOOK_BACK_DAYS = 7
+
+# Seconds a mailbox or processing day stays leased to a worker without a heartbeat
+BATCHER_LEASE_SECONDS = 300
+
+# Seconds batcher_daemon waits between two fetch and process cycles
+BATCHER_DAEMON_INTERVAL = 60
+
+# Days ahead of today that materialize_executions and batcher_daemon keep Executions created for
+BATCHER_MATERIALIZE_DAYS_AHEAD = 7
@@ -13,6 +13,7 @@ from django.contrib import admin
 from django.db import connection
 
 from django_mailbox.models import MessageAttachment, Message, Mailbox
+from batch_apps.models import ProcessingCursor
 from django_mailbox.signals import message_received
 from django_mailbox.utils import convert_header_to_unicode
 
@@ -40,6 +41,7 @@ resend_message_received_signal.short_description = (
 
 def set_as_unprocessed(message_admin, request, queryset):
     queryset.update(processed_batch_apps=False)
+    ProcessingCursor.objects.rewind(queryset)
 set_as_unprocessed.short_description = 'Set as unprocessed by BA'
 
 
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import re
+import unicodedata
+
+BATCH_SIZE = 1000
+WHITESPACE = re.compile(r'\s+')
+
+
+# Frozen copy of batch_apps.matcher.normalize_subject as of this migration
+def normalize_subject(subject):
+    return WHITESPACE.sub(' ', unicodedata.normalize('NFKC', subject).casefold()).strip()
+
+
+def normalize_existing_subjects(apps, schema_editor):
+    Message = apps.get_model('django_mailbox', 'Message')
+    quote_name = schema_editor.quote_name
+    sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+        quote_name(Message._meta.db_table), quote_name('subject_normalized'), quote_name('id'))
+    last_id = 0
+
+    while True:
+        rows = list(Message.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'subject')[:BATCH_SIZE])
+
+        if not rows:
+            return
+
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, [(normalize_subject(subject)[0:255], message_id) for message_id, subject in rows])
+
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mailbox', '0003_messages_matched_processed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='subject_normalized',
+            field=models.CharField(default='', max_length=255, verbose_name='Normalized subject', blank=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(normalize_existing_subjects, lambda apps, schema_editor: None),
+    ]
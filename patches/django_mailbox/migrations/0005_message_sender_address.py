@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from email.utils import parseaddr
+
+BATCH_SIZE = 1000
+
+
+# Frozen copy of batch_apps.matcher.parse_sender_address as of this migration
+def parse_sender_address(from_header):
+    return parseaddr(from_header)[1].lower()
+
+
+def parse_existing_sender_addresses(apps, schema_editor):
+    Message = apps.get_model('django_mailbox', 'Message')
+    quote_name = schema_editor.quote_name
+    sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+        quote_name(Message._meta.db_table), quote_name('sender_address'), quote_name('id'))
+    last_id = 0
+
+    while True:
+        rows = list(Message.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'from_header')[:BATCH_SIZE])
+
+        if not rows:
+            return
+
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, [(parse_sender_address(from_header)[0:255], message_id)
+                                     for message_id, from_header in rows])
+
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mailbox', '0004_message_subject_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='sender_address',
+            field=models.CharField(default='', max_length=255, verbose_name='Sender address', blank=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(parse_existing_sender_addresses, lambda apps, schema_editor: None),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.utils import timezone
+import pytz
+
+BATCH_SIZE = 900
+
+
+# Frozen copy of batch_apps.generator.get_date_in_gmt8 as of this migration
+def get_date_in_gmt8(datetime_):
+    if timezone.is_naive(datetime_):
+        datetime_ = timezone.make_aware(datetime_, timezone.get_default_timezone())
+
+    return datetime_.astimezone(pytz.timezone('Asia/Kuala_Lumpur')).date()
+
+
+def fill_sent_date_local(apps, schema_editor):
+    Message = apps.get_model('django_mailbox', 'Message')
+    message_ids_by_date = {}
+
+    for message_id, sent_time in Message.objects.exclude(sent_time=None).values_list('id', 'sent_time').iterator():
+        message_ids_by_date.setdefault(get_date_in_gmt8(sent_time), []).append(message_id)
+
+    for sent_date_local, message_ids in message_ids_by_date.items():
+        for i in range(0, len(message_ids), BATCH_SIZE):
+            Message.objects.filter(id__in=message_ids[i:i + BATCH_SIZE]).update(sent_date_local=sent_date_local)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mailbox', '0005_message_sender_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='sent_date_local',
+            field=models.DateField(null=True, verbose_name='Sent date (GMT+8)', blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(fill_sent_date_local, lambda apps, schema_editor: None),
+        # The WHERE clause must match UNPROCESSED_MESSAGE_CONDITION in
+        # batch_apps.models word for word for SQLite to use this index.
+        migrations.RunSQL(
+            'CREATE INDEX django_mailbox_message_unprocessed_by_date '
+            'ON django_mailbox_message (sent_date_local, mailbox_id, id) '
+            'WHERE NOT processed_batch_apps AND NOT matched_batch_apps',
+            'DROP INDEX django_mailbox_message_unprocessed_by_date',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_mailbox', '0006_message_sent_date_local'),
+    ]
+
+    operations = [
+        # The WHERE clause must match PROCESSED_UNMATCHED_MESSAGE_CONDITION in
+        # batch_apps.models word for word for SQLite to use this index.
+        migrations.RunSQL(
+            'CREATE INDEX django_mailbox_message_unmatched_by_date '
+            'ON django_mailbox_message (sent_date_local, id) '
+            'WHERE processed_batch_apps AND NOT matched_batch_apps',
+            'DROP INDEX django_mailbox_message_unmatched_by_date',
+        ),
+    ]
@@ -27,6 +27,8 @@ from django.db import models
 from django.utils.translation import ugettext as _
 
 from .utils import convert_header_to_unicode, get_body_from_message
+from batch_apps.generator import get_date_in_gmt8
+from batch_apps.matcher import normalize_subject, parse_sender_address
 from django_mailbox.signals import message_received
 from django_mailbox.transports import Pop3Transport, ImapTransport, \
     MaildirTransport, MboxTransport, BabylTransport, MHTransport, \
@@ -329,10 +331,12 @@ class Mailbox(models.Model):
         msg.mailbox = self
         if 'subject' in message:
             msg.subject = convert_header_to_unicode(message['subject'])[0:255]
+            msg.subject_normalized = normalize_subject(msg.subject)[0:255]
         if 'message-id' in message:
             msg.message_id = message['message-id'][0:255]
         if 'from' in message:
             msg.from_header = convert_header_to_unicode(message['from'])
+            msg.sender_address = parse_sender_address(msg.from_header)[0:255]
         if 'to' in message:
             msg.to_header = convert_header_to_unicode(message['to'])
         if 'date' in message:
@@ -403,6 +407,14 @@ class Message(models.Model):
         max_length=255
     )
 
+    subject_normalized = models.CharField(
+        _(u'Normalized subject'),
+        max_length=255,
+        blank=True,
+        default='',
+        db_index=True,
+    )
+
     message_id = models.CharField(
         _(u'Message ID'),
         max_length=255
@@ -412,6 +424,12 @@ class Message(models.Model):
         _('Sent Time'),
     )
 
+    sent_date_local = models.DateField(
+        _('Sent date (GMT+8)'),
+        blank=True,
+        null=True,
+    )
+
     in_reply_to = models.ForeignKey(
         'django_mailbox.Message',
         related_name='replies',
@@ -425,6 +443,14 @@ class Message(models.Model):
         max_length=255,
     )
 
+    sender_address = models.CharField(
+        _('Sender address'),
+        max_length=255,
+        blank=True,
+        default='',
+        db_index=True,
+    )
+
     to_header = models.TextField(
         _(u'To header'),
     )
@@ -622,6 +648,10 @@ class Message(models.Model):
             flat = email.message_from_string(body)
         return self._rehydrate(flat)
 
+    def save(self, *args, **kwargs):
+        self.sent_date_local = get_date_in_gmt8(self.sent_time) if self.sent_time else None
+        super(Message, self).save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         for attachment in self.attachments.all():
             # This attachment is attached only to this message.